@@ -0,0 +1,86 @@
+"""Асинхронные версии горячих GET-эндпоинтов для режима ASGI.
+
+Подключаются в urls только при SERVER_MODE=asgi. Запросы, которые
+требуют аутентификации или меняют данные, передаются обычным
+DRF-представлениям.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from recipes.catalog import ingredient_catalog
+from recipes.models import Recipes
+
+from .caching import (
+    aget_recipe_bodies,
+    arecipes_version,
+    not_modified,
+    overlay_personal_flags,
+    recipe_validators,
+    set_validators,
+)
+from .short_links import arecipe_exists, decode_short_code, hit_counter
+from .views import RecipesViewSet
+
+JSON_PARAMS = {"ensure_ascii": False, "separators": (",", ":")}
+
+recipe_detail_sync = sync_to_async(RecipesViewSet.as_view({
+    "get": "retrieve",
+    "put": "update",
+    "patch": "partial_update",
+    "delete": "destroy",
+}))
+
+
+@require_GET
+async def ingredients_list(request):
+    name = request.GET.get("name")
+    if name:
+        rows = await ingredient_catalog.asearch(
+            name, settings.INGREDIENTS_SEARCH_LIMIT
+        )
+    else:
+        rows = await ingredient_catalog.aall()
+    return JsonResponse(rows, safe=False, json_dumps_params=JSON_PARAMS)
+
+
+# Как и у DRF-представлений, CSRF проверяет сама DRF и только для
+# сессий: запросы с токеном middleware отклонять не должен.
+@csrf_exempt
+async def recipe_detail(request, pk):
+    if request.method != "GET" or "HTTP_AUTHORIZATION" in request.META:
+        return await recipe_detail_sync(request, pk=pk)
+
+    recipe = await Recipes.objects.only(
+        "id", "author_id", "pub_date", "updated_at"
+    ).filter(pk=pk).afirst()
+    if recipe is None:
+        return await recipe_detail_sync(request, pk=pk)
+
+    etag, last_modified = recipe_validators(
+        await arecipes_version(), recipe, authenticated=False
+    )
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        bodies = await aget_recipe_bodies(request, [recipe])
+        if recipe.pk not in bodies:
+            return await recipe_detail_sync(request, pk=pk)
+        response = JsonResponse(
+            overlay_personal_flags(bodies[recipe.pk], recipe),
+            json_dumps_params=JSON_PARAMS,
+        )
+    return set_validators(response, etag, last_modified)
+
+
+async def s_redirect(request, id):
+    try:
+        recipe_id = decode_short_code(id)
+    except ValueError:
+        raise Http404
+    if not await arecipe_exists(recipe_id):
+        raise Http404
+    hit_counter.record(recipe_id)
+    return redirect(f"/recipes/{recipe_id}/")
@@ -0,0 +1,32 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_CACHE_PREFIX = "api:auth:token"
+
+
+def token_cache_key(key):
+    return f"{TOKEN_CACHE_PREFIX}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def forget_token(key):
+    cache.delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, запоминающая токен с пользователем в кэше.
+
+    Записи живут AUTH_TOKEN_CACHE_TIMEOUT секунд и удаляются раньше
+    при удалении токена (выход) и сохранении пользователя (смена
+    пароля, блокировка, правка профиля).
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            _, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return token.user, token
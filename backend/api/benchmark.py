@@ -0,0 +1,325 @@
+"""Замеры горячих эндпоинтов API для сравнения между коммитами.
+
+Запросы идут либо через тестовый клиент Django в том же процессе
+(видно число SQL-запросов и память процесса), либо по HTTP
+к запущенному серверу несколькими потоками (число запросов берётся
+из Server-Timing, если он включён на сервере).
+
+С --writes замеряются и создание и правка рецепта (POST и PATCH).
+Созданные при этом рецепты удаляются после прогона.
+"""
+
+import base64
+import json
+import os
+import resource
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+from itertools import cycle
+
+from PIL import Image
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from recipes.images import delete_image_variants
+from recipes.models import IngredientInRecipe, Ingredients, Recipes
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+# payloads — бесконечный итератор тел запроса для POST и PATCH.
+Endpoint = namedtuple(
+    "Endpoint", ("name", "path", "authenticated", "method", "payloads"),
+    defaults=("GET", None),
+)
+WRITE_RECIPE_NAME = "Замер записи"
+WRITE_INGREDIENTS = 8
+
+
+def hot_endpoints(recipe):
+    return [
+        Endpoint("recipes_list", "/api/recipes/?limit=6", False),
+        Endpoint("recipes_list_auth", "/api/recipes/?limit=6", True),
+        Endpoint(
+            "recipes_by_author",
+            f"/api/recipes/?author={recipe.author_id}&limit=6", False,
+        ),
+        Endpoint(
+            "recipes_favorited", "/api/recipes/?is_favorited=1&limit=6", True
+        ),
+        Endpoint(
+            "recipes_popular", "/api/recipes/?ordering=popular&limit=6",
+            False,
+        ),
+        Endpoint(
+            "recipes_trending", "/api/recipes/?ordering=trending&limit=6",
+            False,
+        ),
+        Endpoint(
+            "recipes_cursor", "/api/recipes/?pagination=cursor&limit=6", False
+        ),
+        Endpoint("recipes_search", "/api/recipes/?search=суп&limit=6", False),
+        Endpoint("recipe_detail", f"/api/recipes/{recipe.pk}/", False),
+        Endpoint("recipe_detail_auth", f"/api/recipes/{recipe.pk}/", True),
+        Endpoint(
+            "ingredients_autocomplete", "/api/ingredients/?name=мо", False
+        ),
+        Endpoint(
+            "subscriptions",
+            "/api/users/subscriptions/?limit=6&recipes_limit=3", True,
+        ),
+        Endpoint(
+            "shopping_list", "/api/recipes/download_shopping_cart/", True
+        ),
+    ]
+
+
+def benchmark_image():
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), "orange").save(buffer, "PNG")
+    return (
+        "data:image/png;base64,"
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def recipe_payload(image, ingredient_ids, amount):
+    return {
+        "name": WRITE_RECIPE_NAME,
+        "text": "Рецепт для замера создания и правки.",
+        "cooking_time": 10,
+        "image": image,
+        "ingredients": [
+            {"id": ingredient_id, "amount": amount}
+            for ingredient_id in ingredient_ids
+        ],
+    }
+
+
+def write_endpoints(user):
+    """POST и PATCH рецепта пользователя user.
+
+    Правки чередуют два набора ингредиентов, которые пересекаются
+    наполовину: каждый PATCH удаляет, добавляет и меняет строки.
+    """
+    ingredient_ids = list(
+        Ingredients.objects.order_by("id")
+        .values_list("id", flat=True)[:WRITE_INGREDIENTS * 3 // 2]
+    )
+    first = ingredient_ids[:WRITE_INGREDIENTS]
+    second = ingredient_ids[-WRITE_INGREDIENTS:]
+    recipe = Recipes.objects.create(
+        author=user, name=WRITE_RECIPE_NAME, text="", cooking_time=10,
+    )
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(recipe=recipe, ingredient_id=pk, amount=1)
+        for pk in first
+    )
+    image = benchmark_image()
+    return [
+        Endpoint(
+            "recipe_create", "/api/recipes/", True, "POST",
+            cycle([recipe_payload(image, first, 1)]),
+        ),
+        Endpoint(
+            "recipe_update", f"/api/recipes/{recipe.pk}/", True, "PATCH",
+            cycle([
+                recipe_payload(image, second, 2),
+                recipe_payload(image, first, 3),
+            ]),
+        ),
+    ]
+
+
+def delete_write_recipes(user):
+    """Удаляет рецепты, созданные write_endpoints и замером, с файлами."""
+    recipes = Recipes.objects.filter(author=user, name=WRITE_RECIPE_NAME)
+    for recipe in recipes:
+        if recipe.image:
+            delete_image_variants(recipe.image, recipe.image_widths)
+            recipe.image.delete(save=False)
+        recipe.delete()
+
+
+def request_body(endpoint):
+    if endpoint.payloads is None:
+        return None
+    return json.dumps(next(endpoint.payloads), ensure_ascii=False)
+
+
+def benchmark_user():
+    """Пользователь с самой большой корзиной — худший случай."""
+    return (
+        User.objects.annotate(cart_size=Count("shopping_cart"))
+        .order_by("-cart_size", "id").first()
+    )
+
+
+def popular_recipe():
+    return Recipes.objects.order_by("-favorites_count", "id").first()
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))
+    return ordered[index]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(durations, queries, errors):
+    ms = [seconds * 1000 for seconds in durations]
+    return {
+        "requests": len(ms),
+        "errors": errors,
+        "p50_ms": percentile(ms, 0.50),
+        "p95_ms": percentile(ms, 0.95),
+        "p99_ms": percentile(ms, 0.99),
+        "mean_ms": sum(ms) / len(ms) if ms else None,
+        "queries_per_request": (
+            sum(queries) / len(queries) if queries else None
+        ),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ("git", "rev-parse", "--short", "HEAD"),
+            capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ClientRunner:
+    """Последовательные запросы через тестовый клиент Django."""
+
+    mode = "client"
+
+    def __init__(self, token):
+        host = settings.ALLOWED_HOSTS[0]
+        self.client = Client(
+            HTTP_HOST="localhost" if host in ("*", "") else host
+        )
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {token}"}
+
+    def request(self, endpoint):
+        headers = self.auth if endpoint.authenticated else {}
+        body = request_body(endpoint)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = self.client.generic(
+                endpoint.method, endpoint.path, body or "",
+                content_type="application/json", **headers,
+            )
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return elapsed, len(captured), response.status_code < 400
+
+    def run(self, endpoint, count):
+        durations, queries, errors = [], [], 0
+        for _ in range(count):
+            elapsed, query_count, ok = self.request(endpoint)
+            durations.append(elapsed)
+            queries.append(query_count)
+            errors += not ok
+        result = summarize(durations, queries, errors)
+        result["rss_mb"] = round(rss_mb(), 1)
+        return result
+
+
+class HttpRunner:
+    """Параллельные запросы к запущенному серверу."""
+
+    mode = "http"
+
+    def __init__(self, base_url, token, concurrency):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.concurrency = concurrency
+
+    def request(self, endpoint):
+        body = request_body(endpoint)
+        request = urllib.request.Request(
+            self.base_url + quote(endpoint.path, safe="/?&="),
+            data=body.encode() if body is not None else None,
+            method=endpoint.method,
+        )
+        if body is not None:
+            request.add_header("Content-Type", "application/json")
+        if endpoint.authenticated:
+            request.add_header("Authorization", f"Token {self.token}")
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                timing = response.headers.get("Server-Timing", "")
+                ok = True
+        except urllib.error.URLError:
+            timing, ok = "", False
+        return time.perf_counter() - started, server_queries(timing), ok
+
+    def run(self, endpoint, count):
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            results = list(executor.map(
+                lambda _: self.request(endpoint), range(count)
+            ))
+        result = summarize(
+            [elapsed for elapsed, _, _ in results],
+            [queries for _, queries, _ in results if queries is not None],
+            sum(not ok for _, _, ok in results),
+        )
+        result["rss_mb"] = None
+        return result
+
+
+def server_queries(timing):
+    for metric in timing.split(","):
+        name, _, rest = metric.strip().partition(";")
+        if name == "queries" and 'desc="' in rest:
+            try:
+                return int(rest.split('desc="')[1].rstrip('"'))
+            except ValueError:
+                return None
+    return None
+
+
+def run_benchmark(runner, endpoints, count, warmup):
+    results = {}
+    for endpoint in endpoints:
+        if warmup:
+            runner.run(endpoint, warmup)
+        results[endpoint.name] = runner.run(endpoint, count)
+    return {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "mode": runner.mode,
+        "requests_per_endpoint": count,
+        "endpoints": results,
+    }
+
+
+def benchmark_token(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    return token.key
@@ -0,0 +1,165 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (
+    get_conditional_response,
+    patch_vary_headers,
+    quote_etag,
+)
+from django.db.models import Value
+from django.utils.http import http_date
+from foodgram.metrics import measure
+from recipes.cache_versions import (
+    RECIPE_BODY_VERSION,
+    RECIPE_SCORES_VERSION,
+    RECIPES_VERSION,
+    aget_version,
+    get_version,
+    version_timestamp,
+)
+from recipes.models import Recipes
+
+from .filters import RANKED_ORDERINGS
+from .serializers import RecipesSerializer
+
+LIST_CACHE_PREFIX = "api:recipes:list"
+BODY_CACHE_PREFIX = "api:recipes:body"
+PERSONAL_FLAGS = (
+    "is_favorited", "is_in_shopping_cart", "author_is_subscribed"
+)
+
+
+def make_etag(*parts):
+    return quote_etag(
+        hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+    )
+
+
+def recipes_version():
+    return get_version(RECIPES_VERSION)
+
+
+async def arecipes_version():
+    return await aget_version(RECIPES_VERSION)
+
+
+def list_version(request):
+    """Ленты popular и trending устаревают ещё и после пересчёта оценок."""
+    version = recipes_version()
+    if request.query_params.get("ordering") in RANKED_ORDERINGS:
+        version = f"{version}:{get_version(RECIPE_SCORES_VERSION)}"
+    return version
+
+
+def list_cache_key(version, url):
+    digest = hashlib.md5(url.encode()).hexdigest()
+    return f"{LIST_CACHE_PREFIX}:{version}:{digest}"
+
+
+def recipe_validators(version, recipe, authenticated):
+    flags = [getattr(recipe, flag, False) for flag in PERSONAL_FLAGS]
+    etag = make_etag(version, recipe.pk, recipe.updated_at, *flags)
+    # Last-Modified не учитывает флаги пользователя, поэтому
+    # для авторизованных запросов остаётся только ETag. Тело рецепта
+    # меняется и без updated_at (автор, ингредиенты) — тогда меняется
+    # версия, и берётся время её смены.
+    changed = version_timestamp(version)
+    if authenticated or changed is None:
+        return etag, None
+    return etag, max(int(recipe.updated_at.timestamp()), changed)
+
+
+def not_modified(request, etag, last_modified=None):
+    return get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+
+
+def set_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_vary_headers(response, ("Authorization",))
+    return response
+
+
+def recipe_body_key(version, base_url, recipe):
+    return (
+        f"{BODY_CACHE_PREFIX}:{version}:{base_url}:"
+        f"{recipe.pk}:{recipe.updated_at.timestamp()}"
+    )
+
+
+def serialize_recipe_bodies(request, pks):
+    recipes = (
+        Recipes.objects
+        .filter(pk__in=pks)
+        .select_related("author")
+        .prefetch_related("recipe_ingredients")
+        .annotate(**{flag: Value(False) for flag in PERSONAL_FLAGS})
+    )
+    serializer = RecipesSerializer(
+        recipes, many=True, context={"request": request}
+    )
+    with measure("serialize"):
+        return {body["id"]: dict(body) for body in serializer.data}
+
+
+def _body_keys(request, recipes, version):
+    base_url = request.build_absolute_uri("/")
+    return {
+        recipe.pk: recipe_body_key(version, base_url, recipe)
+        for recipe in recipes
+    }
+
+
+def get_recipe_bodies(request, recipes):
+    """Общие для всех пользователей представления рецептов {pk: body}.
+
+    Недостающие в кэше рецепты сериализуются и кладутся в кэш.
+    """
+    keys = _body_keys(request, recipes, get_version(RECIPE_BODY_VERSION))
+    cached = cache.get_many(keys.values())
+    bodies = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in keys if pk not in bodies]
+    if missing:
+        fresh = serialize_recipe_bodies(request, missing)
+        cache.set_many(
+            {keys[pk]: body for pk, body in fresh.items()},
+            settings.RECIPE_BODY_CACHE_TIMEOUT,
+        )
+        bodies.update(fresh)
+    return bodies
+
+
+async def aget_recipe_bodies(request, recipes):
+    keys = _body_keys(
+        request, recipes, await aget_version(RECIPE_BODY_VERSION)
+    )
+    cached = await cache.aget_many(keys.values())
+    bodies = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in keys if pk not in bodies]
+    if missing:
+        fresh = await sync_to_async(serialize_recipe_bodies)(
+            request, missing
+        )
+        await cache.aset_many(
+            {keys[pk]: body for pk, body in fresh.items()},
+            settings.RECIPE_BODY_CACHE_TIMEOUT,
+        )
+        bodies.update(fresh)
+    return bodies
+
+
+def overlay_personal_flags(body, recipe):
+    body = dict(body)
+    body["is_favorited"] = getattr(recipe, "is_favorited", False)
+    body["is_in_shopping_cart"] = getattr(
+        recipe, "is_in_shopping_cart", False)
+    body["author"] = {
+        **body["author"],
+        "is_subscribed": getattr(recipe, "author_is_subscribed", False),
+    }
+    return body
@@ -1,30 +1,93 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Count, Exists, F, OuterRef, Q
 from django_filters import rest_framework as filters
-from recipes.models import Recipes
+from recipes.models import Favorites, Recipes, ShoppingCart
+from recipes.search import SEARCH_CONFIG, supports_full_text_search
+
+
+RECIPE_ORDERINGS = {
+    "new": ("-pub_date", "-id"),
+    "popular": ("-popularity", "-id"),
+    "trending": ("-trending_score", "-id"),
+}
+# Ленты по оценкам из refresh_recipe_scores.
+RANKED_ORDERINGS = ("popular", "trending")
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(method="filter_shopping_cart")
     is_favorited = filters.BooleanFilter(method="filter_favorites")
     author = filters.NumberFilter(field_name="author__id")
+    search = filters.CharFilter(method="filter_search")
+    ingredients = NumberInFilter(method="filter_ingredients")
+    # Последним, чтобы перекрыть сортировку поиска и ингредиентов.
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method="filter_ordering",
+    )
 
     class Meta:
         model = Recipes
-        fields = ["author", "is_in_shopping_cart", "is_favorited"]
+        fields = [
+            "author", "is_in_shopping_cart", "is_favorited",
+            "search", "ingredients", "ordering",
+        ]
 
-    def filter_shopping_cart(self, queryset, name, value):
+    def filter_ingredients(self, queryset, name, value):
+        available = Q(recipe_ingredients__ingredient_id__in=[
+            int(ingredient_id) for ingredient_id in value
+        ])
+        return (
+            queryset
+            .annotate(
+                matched_count=Count("recipe_ingredients", filter=available),
+                missing_count=Count("recipe_ingredients", filter=~available),
+            )
+            .filter(matched_count__gt=0)
+            .order_by("missing_count", "-matched_count", "-pub_date")
+        )
+
+    def filter_search(self, queryset, name, value):
+        if not supports_full_text_search(queryset.db):
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type="websearch"
+        )
+        return (
+            queryset
+            .filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "-pub_date")
+        )
+
+    def _filter_by_user_link(self, queryset, model, value):
+        """EXISTS / NOT EXISTS по паре (user, recipe).
+
+        exclude() по обратной связи даёт NOT IN (подзапрос), который
+        PostgreSQL не может выполнить как anti-join.
+        """
         user = self.request.user
         if not user.is_authenticated:
             return queryset.none()
 
+        linked = Exists(
+            model.objects.filter(user=user, recipe=OuterRef("pk"))
+        )
         if str(value).lower() in ("true", "1"):
-            return queryset.filter(in_shopping_cart__user=user)
-        return queryset.exclude(in_shopping_cart__user=user)
+            return queryset.filter(linked)
+        return queryset.filter(~linked)
+
+    def filter_shopping_cart(self, queryset, name, value):
+        return self._filter_by_user_link(queryset, ShoppingCart, value)
 
     def filter_favorites(self, queryset, name, value):
-        user = self.request.user
-        if not user.is_authenticated:
-            return queryset.none()
+        return self._filter_by_user_link(queryset, Favorites, value)
 
-        if str(value).lower() in ("true", "1"):
-            return queryset.filter(favorited_by_user__user=user)
-        return queryset.exclude(favorited_by_user__user=user)
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
@@ -0,0 +1,101 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import (
+    ClientRunner,
+    HttpRunner,
+    benchmark_token,
+    benchmark_user,
+    delete_write_recipes,
+    hot_endpoints,
+    popular_recipe,
+    run_benchmark,
+    write_endpoints,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет p50/p95/p99, SQL-запросы и память на горячих "
+        "эндпоинтах и сохраняет результат в JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument(
+            "--url",
+            help="Адрес запущенного сервера; без него запросы идут "
+                 "через тестовый клиент в этом процессе.",
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--only", action="append", metavar="ENDPOINT",
+            help="Замерить только указанные эндпоинты.",
+        )
+        parser.add_argument(
+            "--writes", action="store_true",
+            help="Замерить и создание/правку рецепта (POST и PATCH). "
+                 "Созданные рецепты удаляются после прогона.",
+        )
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument(
+            "--baseline", help="Прошлый результат для сравнения."
+        )
+
+    def handle(self, *args, **options):
+        user, recipe = benchmark_user(), popular_recipe()
+        if user is None or recipe is None:
+            raise CommandError(
+                "Нет данных, сначала выполните seed_benchmark_data."
+            )
+        endpoints = hot_endpoints(recipe)
+        if options["writes"]:
+            endpoints += write_endpoints(user)
+        if options["only"]:
+            endpoints = [
+                endpoint for endpoint in endpoints
+                if endpoint.name in options["only"]
+            ]
+        token = benchmark_token(user)
+        if options["url"]:
+            runner = HttpRunner(options["url"], token, options["concurrency"])
+        else:
+            runner = ClientRunner(token)
+
+        try:
+            report = run_benchmark(
+                runner, endpoints, options["requests"], options["warmup"]
+            )
+        finally:
+            if options["writes"]:
+                delete_write_recipes(user)
+        with open(options["output"], "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+        baseline = {}
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as file:
+                baseline = json.load(file)["endpoints"]
+        for name, result in report["endpoints"].items():
+            self.stdout.write(
+                self.format_row(name, result, baseline.get(name))
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Результат сохранён в {options['output']}"
+        ))
+
+    def format_row(self, name, result, previous):
+        row = (
+            f"{name:<26} p50 {result['p50_ms']:8.2f} "
+            f"p95 {result['p95_ms']:8.2f} p99 {result['p99_ms']:8.2f} мс"
+        )
+        if result["queries_per_request"] is not None:
+            row += f"  SQL {result['queries_per_request']:.1f}"
+        if result["errors"]:
+            row += f"  ошибок {result['errors']}"
+        if previous and previous.get("p95_ms"):
+            change = result["p95_ms"] / previous["p95_ms"] - 1
+            row += f"  p95 {change:+.0%}"
+        return row
@@ -0,0 +1,170 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .filters import RECIPE_ORDERINGS
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану PostgreSQL вместо COUNT(*)."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+class FeedPagination(LimitOffsetPagination):
+    """limit/offset по умолчанию, keyset-режим по ?pagination=cursor.
+
+    В keyset-режиме страница выбирается условием по полям
+    сортировки после последней строки предыдущей страницы,
+    без OFFSET. Сортировка — keyset_ordering или одна из
+    keyset_orderings, если queryset уже так отсортирован. Общее
+    число строк не считается, если не передан
+    ?count=exact или ?count=approx. Другие сортировки (поиск,
+    подбор по ингредиентам) в keyset-режиме не поддерживаются —
+    на такой запрос отвечаем 400.
+    """
+
+    keyset_ordering = RECIPE_ORDERINGS["new"]
+    keyset_orderings = tuple(RECIPE_ORDERINGS.values())
+    mode_query_param = "pagination"
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Неверный курсор."
+    unsupported_ordering_message = (
+        "Курсорная пагинация доступна только с ordering."
+    )
+
+    keyset = False
+
+    def is_keyset_requested(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.is_keyset_requested(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request) or self.default_limit
+        self.ordering = self.get_keyset_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        self.count = self.get_keyset_count(queryset, request)
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        rows = list(queryset[:self.limit + 1])
+        self.next_position = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            self.next_position = [
+                getattr(rows[-1], field.lstrip("-"))
+                for field in self.ordering
+            ]
+        return rows
+
+    def get_keyset_ordering(self, queryset):
+        ordering = tuple(queryset.query.order_by)
+        if not ordering:
+            return self.keyset_ordering
+        if ordering in self.keyset_orderings:
+            return ordering
+        raise ParseError(self.unsupported_ordering_message)
+
+    def get_keyset_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == "exact":
+            return queryset.count()
+        if mode == "approx":
+            return estimate_count(queryset)
+        return None
+
+    def after(self, position):
+        """(a, b, c) после (x, y, z): a > x или a = x и b > y и т. д.
+        Граница по первому полю добавляется отдельно — одно такое
+        условие PostgreSQL использует как границу сканирования
+        индекса, а дизъюнкцию целиком — нет."""
+        first = self.ordering[0]
+        lookup = "lte" if first.startswith("-") else "gte"
+        bound = Q(**{f"{first.lstrip('-')}__{lookup}": position[0]})
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            equal = [
+                Q(**{previous.lstrip("-"): value})
+                for previous, value in zip(
+                    self.ordering[:index], position
+                )
+            ]
+            conditions.append(reduce(
+                and_, equal, Q(**{f"{name}__{lookup}": position[index]})
+            ))
+        return bound & reduce(or_, conditions)
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, default=str).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        payload = {"next": self.get_next_link(), "results": data}
+        if self.count is not None:
+            payload = {"count": self.count, **payload}
+        return Response(payload)
+
+
+class SubscriptionsPagination(FeedPagination):
+    keyset_ordering = ("first_name", "last_name", "id")
+    keyset_orderings = ()
@@ -0,0 +1,19 @@
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .exceptions import PayloadTooLarge
+
+
+class LimitedJSONParser(JSONParser):
+    """Отклоняет тело больше API_MAX_REQUEST_SIZE до его чтения."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get("request")
+        if request is not None:
+            try:
+                length = int(request.META.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                length = 0
+            if length > settings.API_MAX_REQUEST_SIZE:
+                raise PayloadTooLarge
+        return super().parse(stream, media_type, parser_context)
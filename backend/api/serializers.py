@@ -4,33 +4,161 @@ from recipes.models import (
     Ingredients, Recipes, IngredientInRecipe,
     MAX_INGREDIENT, MIN_INGREDIENT,
 )
+from recipes.catalog import ingredient_catalog
+from recipes.images import (
+    delete_image_variants,
+    image_srcset,
+    schedule_image_processing,
+    widths_field,
+)
+from recipes.shopping_totals import change_recipe_in_shopping_totals
+
+from .exceptions import PayloadTooLarge
 
 import re
 import base64
+import binascii
+from io import BytesIO
 
+from PIL import Image
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import password_validation
-from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
 
 MAX_PASSWORD_LENGTH = 128
+BASE64_CHUNK_SIZE = 64 * 1024
+# Переносы строк допустимы (base64.encodebytes, MIME).
+BASE64_WHITESPACE = " \t\r\n"
+# Расширение временного файла берётся отсюда, а не из запроса.
+BASE64_IMAGE_TYPES = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+}
+
+
+class Base64Upload(TemporaryUploadedFile):
+    """Временный файл, который хранилище может переместить на место
+    без копирования. Закрывается сам, когда больше не нужен."""
+
+    def __del__(self):
+        # file не задан, если временный файл не удалось создать.
+        if getattr(self, "file", None) is not None:
+            self.close()
 
 
 class Base64ImageField(serializers.ImageField):
+    """Декодирует data:image/...;base64 по частям во временный файл
+    на диске, без второй полной копии картинки в памяти.
+
+    Размер проверяется по длине base64 до декодирования, разрешение —
+    по заголовку из первого куска, до декодирования остальных.
+    """
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
-        return super().to_internal_value(data)
+            data = self.decode(data)
+        else:
+            self.check_size(getattr(data, "size", 0))
+        file = super().to_internal_value(data)
+        image = getattr(file, "image", None)
+        if image is not None:
+            self.check_dimensions(*image.size)
+        return file
+
+    def check_size(self, size):
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if size > max_size:
+            raise PayloadTooLarge(
+                f"Изображение больше {max_size / 1024 / 1024:g} МБ."
+            )
+
+    def check_dimensions(self, width, height):
+        max_dimension = settings.IMAGE_UPLOAD_MAX_DIMENSION
+        if max(width, height) > max_dimension:
+            raise serializers.ValidationError(
+                f"Изображение больше {max_dimension} пикселей по стороне."
+            )
+
+    def check_header(self, head):
+        try:
+            with Image.open(BytesIO(head)) as image:
+                size = image.size
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # Заголовок не уместился в первый кусок или повреждён:
+            # картинку целиком проверит ImageField.
+            return
+        self.check_dimensions(*size)
+
+    def decode(self, data):
+        header, separator, encoded = data.partition(";base64,")
+        content_type = header.removeprefix("data:")
+        extension = BASE64_IMAGE_TYPES.get(content_type)
+        if not separator or extension is None:
+            self.fail("invalid_image")
+        length = len(encoded) - sum(map(encoded.count, BASE64_WHITESPACE))
+        self.check_size(
+            length * 3 // 4 - encoded.rstrip()[-2:].count("=")
+        )
+        upload = Base64Upload("temp." + extension, content_type, 0, None)
+        # Без пробелов кусок может не делиться на 4: остаток
+        # переносится в следующий.
+        pending = ""
+        try:
+            for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                pending += "".join(
+                    encoded[start:start + BASE64_CHUNK_SIZE].split()
+                )
+                usable = len(pending) - len(pending) % 4
+                chunk = base64.b64decode(pending[:usable], validate=True)
+                pending = pending[usable:]
+                if chunk and not upload.tell():
+                    self.check_header(chunk)
+                upload.write(chunk)
+            if pending:
+                raise binascii.Error("Неполный base64.")
+        except binascii.Error:
+            upload.close()
+            self.fail("invalid_image")
+        except serializers.ValidationError:
+            upload.close()
+            raise
+        upload.size = upload.tell()
+        upload.seek(0)
+        return upload
+
+
+class ImageSrcsetField(serializers.Field):
+    """srcset с уменьшенными копиями изображения из поля image_field."""
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs.update(source="*", read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        request = self.context.get("request")
+        return image_srcset(
+            getattr(instance, self.image_field),
+            getattr(instance, widths_field(self.image_field), ()),
+            request.build_absolute_uri if request else None,
+        )
 
 
 class BriefRecipesSerializer(serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField("image")
+
     class Meta:
         model = Recipes
         fields = (
             "id",
             "name",
             "image",
+            "image_srcset",
             "cooking_time"
         )
 
@@ -46,10 +174,7 @@ class IngredientsSerializer(serializers.ModelSerializer):
 
 
 class IngredientInRecipeCreateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredients.objects.all(),
-        source="ingredient"
-    )
+    id = serializers.IntegerField(source="ingredient_id")
     amount = serializers.IntegerField(
         min_value=MIN_INGREDIENT, max_value=MAX_INGREDIENT
     )
@@ -64,12 +189,9 @@ class IngredientInRecipeCreateSerializer(serializers.ModelSerializer):
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(
-        source="ingredient.id")
-    name = serializers.ReadOnlyField(
-        source="ingredient.name")
-    measurement_unit = serializers.ReadOnlyField(
-        source="ingredient.measurement_unit"
-    )
+        source="ingredient_id")
+    name = serializers.SerializerMethodField()
+    measurement_unit = serializers.SerializerMethodField()
 
     class Meta:
         model = IngredientInRecipe
@@ -80,6 +202,22 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
             "amount"
         )
 
+    def _catalog_entry(self, obj):
+        data = self.context.get("ingredient_catalog")
+        if data is None:
+            entry = ingredient_catalog.get(obj.ingredient_id)
+        else:
+            entry = ingredient_catalog.lookup(data, obj.ingredient_id)
+        if entry is None:
+            return obj.ingredient.name, obj.ingredient.measurement_unit
+        return entry
+
+    def get_name(self, obj):
+        return self._catalog_entry(obj)[0]
+
+    def get_measurement_unit(self, obj):
+        return self._catalog_entry(obj)[1]
+
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -105,15 +243,18 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
 class UserDetailSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_srcset = ImageSrcsetField("avatar")
 
     class Meta:
         model = User
         fields = (
             "id", "email", "username", "first_name",
-            "last_name", "avatar", "is_subscribed",
+            "last_name", "avatar", "avatar_srcset", "is_subscribed",
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         request = self.context.get("request")
         return (
             request and request.user.is_authenticated
@@ -123,16 +264,16 @@ class UserDetailSerializer(serializers.ModelSerializer):
 
 class FollowSerializer(UserDetailSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserDetailSerializer.Meta):
         fields = (*UserDetailSerializer.Meta.fields,
                   "recipes", "recipes_count")
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
+        if hasattr(obj, "page_recipes"):
+            return BriefRecipesSerializer(
+                obj.page_recipes, many=True, context=self.context).data
         queryset = obj.recipes.all()
         if limit := self.context["request"].query_params.get("recipes_limit"):
             queryset = queryset[:int(limit)] if limit.isdigit() else queryset
@@ -142,10 +283,21 @@ class FollowSerializer(UserDetailSerializer):
 
 class AvatarUpdateSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField(required=True)
+    avatar_srcset = ImageSrcsetField("avatar")
 
     class Meta:
         model = User
-        fields = ("avatar",)
+        fields = ("avatar", "avatar_srcset")
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        if instance.avatar:
+            previous = (instance.avatar, instance.avatar_widths)
+            transaction.on_commit(lambda: delete_image_variants(*previous))
+        validated_data["avatar_widths"] = []
+        instance = super().update(instance, validated_data)
+        schedule_image_processing(instance, "avatar")
+        return instance
 
 
 class PasswordUpdateSerializer(serializers.Serializer):
@@ -186,6 +338,7 @@ class RecipesSerializer(serializers.ModelSerializer):
         allow_null=False,
         required=True
     )
+    image_srcset = ImageSrcsetField("image")
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     cooking_time = serializers.IntegerField(
@@ -197,7 +350,7 @@ class RecipesSerializer(serializers.ModelSerializer):
         fields = (
             "id", "author", "ingredients",
             "is_in_shopping_cart", "is_favorited",
-            "name", "image", "text", "cooking_time"
+            "name", "image", "image_srcset", "text", "cooking_time"
         )
 
     def validate_image(self, value):
@@ -213,7 +366,13 @@ class RecipesSerializer(serializers.ModelSerializer):
                 "Нужен хотя бы один ингредиент."
             )
 
-        ingredient_ids = [item["ingredient"].id for item in value]
+        ingredient_ids = [item["ingredient_id"] for item in value]
+
+        if missing := ingredient_catalog.missing(ingredient_ids):
+            raise serializers.ValidationError(
+                "Несуществующие ингредиенты: "
+                + ", ".join(map(str, missing))
+            )
 
         if len(set(ingredient_ids)) != len(ingredient_ids):
             raise serializers.ValidationError(
@@ -238,6 +397,8 @@ class RecipesSerializer(serializers.ModelSerializer):
         return data
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         user = self.context["request"].user
         return (
             user.is_authenticated
@@ -245,23 +406,27 @@ class RecipesSerializer(serializers.ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         user = self.context["request"].user
         return (
             user.is_authenticated
             and user.favorite_recipes.filter(recipe=obj).exists()
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredients")
         recipe = Recipes.objects.create(**validated_data)
         self._save_ingredients(recipe, ingredients_data)
+        schedule_image_processing(recipe, "image")
         return recipe
 
     def _save_ingredients(self, recipe, ingredients_data):
         recipe_ingredients = [
             IngredientInRecipe(
                 recipe=recipe,
-                ingredient=ingredient["ingredient"],
+                ingredient_id=ingredient["ingredient_id"],
                 amount=ingredient["amount"],
             )
             for ingredient in ingredients_data
@@ -269,25 +434,85 @@ class RecipesSerializer(serializers.ModelSerializer):
         IngredientInRecipe.objects.bulk_create(recipe_ingredients)
 
     def to_representation(self, instance):
+        if hasattr(instance, "author_is_subscribed"):
+            instance.author.is_subscribed = instance.author_is_subscribed
         representation = super().to_representation(instance)
         representation.update({
             "ingredients": IngredientInRecipeSerializer(
                 instance.recipe_ingredients.all(),
-                many=True
+                many=True,
+                context={"ingredient_catalog": self._ingredient_catalog()},
             ).data,
             "image": representation.get("image") or ""
         })
         return representation
 
+    def _ingredient_catalog(self):
+        """Снимок справочника один на всю сериализацию (в том числе
+        на все рецепты страницы): версия в кэше читается один раз."""
+        context = self.context
+        if "ingredient_catalog" not in context:
+            context["ingredient_catalog"] = ingredient_catalog.snapshot()
+        return context["ingredient_catalog"]
+
+    def _update_ingredients(self, recipe, ingredients_data):
+        amounts = {
+            item["ingredient_id"]: item["amount"] for item in ingredients_data
+        }
+        existing = {
+            row.ingredient_id: row for row in recipe.recipe_ingredients.all()
+        }
+        # Удалённые строки списки покупок учитывают в post_delete;
+        # bulk_update и bulk_create сигналов не шлют, их разницу
+        # переносим сами.
+        amount_deltas = {}
+
+        removed = [
+            row.id for ingredient_id, row in existing.items()
+            if ingredient_id not in amounts
+        ]
+        if removed:
+            IngredientInRecipe.objects.filter(id__in=removed).delete()
+
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                amount_deltas[ingredient_id] = amount - row.amount
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ["amount"])
+
+        added = [
+            item for item in ingredients_data
+            if item["ingredient_id"] not in existing
+        ]
+        if added:
+            self._save_ingredients(recipe, added)
+            amount_deltas.update(
+                (item["ingredient_id"], item["amount"]) for item in added
+            )
+        change_recipe_in_shopping_totals(recipe.pk, amount_deltas)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop("ingredients", None)
+        if "image" in validated_data:
+            if instance.image:
+                previous = (instance.image, instance.image_widths)
+                transaction.on_commit(
+                    lambda: delete_image_variants(*previous)
+                )
+            validated_data["image_widths"] = []
 
         for field, value in validated_data.items():
             setattr(instance, field, value)
         instance.save()
 
         if ingredients_data is not None:
-            instance.ingredients.clear()
-            self._save_ingredients(instance, ingredients_data)
+            self._update_ingredients(instance, ingredients_data)
+        if "image" in validated_data:
+            schedule_image_processing(instance, "image")
 
         return instance
@@ -0,0 +1,94 @@
+import csv
+import json
+from collections import namedtuple
+
+from django.db.models import F
+from recipes.models import ShoppingListTotal
+
+CHUNK_SIZE = 500
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _user_rows(user):
+    return (
+        ShoppingListTotal.objects
+        .filter(user=user)
+        .values(
+            "total",
+            title=F("ingredient__name"),
+            measure=F("ingredient__measurement_unit"),
+        )
+        .order_by("title")
+    )
+
+
+def shopping_list_rows(user):
+    return _user_rows(user).iterator(chunk_size=CHUNK_SIZE)
+
+
+def ashopping_list_rows(user):
+    return _user_rows(user).aiterator(chunk_size=CHUNK_SIZE)
+
+
+ShoppingListFormat = namedtuple(
+    "ShoppingListFormat",
+    ("head", "line", "separator", "tail", "content_type"),
+)
+
+
+def render(file_format, rows):
+    yield file_format.head
+    separator = ""
+    for row in rows:
+        yield separator + file_format.line(row)
+        separator = file_format.separator
+    yield file_format.tail
+
+
+async def arender(file_format, rows):
+    """Как render, но по асинхронным строкам: под ASGI Django
+    иначе собирает весь синхронный поток в список в памяти."""
+    yield file_format.head
+    separator = ""
+    async for row in rows:
+        yield separator + file_format.line(row)
+        separator = file_format.separator
+    yield file_format.tail
+
+
+def txt_line(row):
+    return f"* {row['title']} — {row['total']} {row['measure']}\n"
+
+
+_csv_writer = csv.writer(_Echo())
+
+
+def csv_line(row):
+    return _csv_writer.writerow((row["title"], row["total"], row["measure"]))
+
+
+def json_line(row):
+    return json.dumps({
+        "name": row["title"],
+        "amount": row["total"],
+        "measurement_unit": row["measure"],
+    }, ensure_ascii=False)
+
+
+SHOPPING_LIST_FORMATS = {
+    "txt": ShoppingListFormat(
+        "Список необходимых продуктов:\n\n", txt_line, "", "",
+        "text/plain; charset=utf-8",
+    ),
+    "csv": ShoppingListFormat(
+        _csv_writer.writerow(("Продукт", "Количество", "Единица")),
+        csv_line, "", "", "text/csv; charset=utf-8",
+    ),
+    "json": ShoppingListFormat(
+        "[", json_line, ",", "]", "application/json; charset=utf-8",
+    ),
+}
@@ -0,0 +1,160 @@
+"""Короткие ссылки /s/<code>/ на рецепты.
+
+Код — id рецепта в base36 или, при SHORT_LINK_CODES = "hashid",
+id, перемешанный ключевой перестановкой (сеть Фейстеля с ключом из
+SECRET_KEY), чтобы коды нельзя было перебрать подряд. Наличие
+рецепта кэшируется в общем кэше Django, переходы копятся в памяти
+процесса и записываются в базу пачками.
+"""
+
+import atexit
+import hashlib
+import hmac
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Case, F, IntegerField, Value, When
+from django.http import Http404
+from django.shortcuts import redirect
+from recipes.models import Recipes
+
+from .utils import NUMERAL_BASE, encode36
+
+EXISTS_CACHE_PREFIX = "api:short-link"
+HASHID_BITS = 40
+HASHID_LENGTH = 8
+HASHID_ROUNDS = 4
+_HALF_BITS = HASHID_BITS // 2
+_HALF_MASK = (1 << _HALF_BITS) - 1
+
+
+def _round(value, index):
+    digest = hmac.new(
+        settings.SECRET_KEY.encode(),
+        f"short-link:{index}:{value}".encode(),
+        hashlib.sha256,
+    ).digest()
+    return int.from_bytes(digest[:4], "big") & _HALF_MASK
+
+
+def _permute(number):
+    left, right = number >> _HALF_BITS, number & _HALF_MASK
+    for index in range(HASHID_ROUNDS):
+        left, right = right, left ^ _round(right, index)
+    return (left << _HALF_BITS) | right
+
+
+def _unpermute(number):
+    left, right = number >> _HALF_BITS, number & _HALF_MASK
+    for index in reversed(range(HASHID_ROUNDS)):
+        left, right = right ^ _round(left, index), left
+    return (left << _HALF_BITS) | right
+
+
+def encode_short_code(recipe_id):
+    if settings.SHORT_LINK_CODES != "hashid":
+        return encode36(recipe_id)
+    if recipe_id >> HASHID_BITS:
+        raise ValueError("id не помещается в короткий код.")
+    return encode36(_permute(recipe_id)).rjust(HASHID_LENGTH, "0")
+
+
+def decode_short_code(code):
+    """id рецепта по коду; ValueError для некорректного кода."""
+    if settings.SHORT_LINK_CODES != "hashid":
+        return int(code, NUMERAL_BASE)
+    if len(code) != HASHID_LENGTH or not code.isalnum():
+        raise ValueError("Некорректный код.")
+    number = int(code, NUMERAL_BASE)
+    if number >> HASHID_BITS:
+        raise ValueError("Некорректный код.")
+    return _unpermute(number)
+
+
+def exists_cache_key(recipe_id):
+    return f"{EXISTS_CACHE_PREFIX}:{recipe_id}"
+
+
+def recipe_exists(recipe_id):
+    key = exists_cache_key(recipe_id)
+    exists = cache.get(key)
+    if exists is None:
+        exists = Recipes.objects.filter(id=recipe_id).exists()
+        cache.set(key, exists, settings.SHORT_LINK_CACHE_TIMEOUT)
+    return exists
+
+
+async def arecipe_exists(recipe_id):
+    key = exists_cache_key(recipe_id)
+    exists = await cache.aget(key)
+    if exists is None:
+        exists = await Recipes.objects.filter(id=recipe_id).aexists()
+        await cache.aset(key, exists, settings.SHORT_LINK_CACHE_TIMEOUT)
+    return exists
+
+
+def forget_recipe(recipe_id):
+    cache.delete(exists_cache_key(recipe_id))
+
+
+class HitCounter:
+    """Копит переходы по ссылкам и раз в SHORT_LINK_HITS_FLUSH_INTERVAL
+    секунд записывает их одним UPDATE из фонового потока."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._timer = None
+
+    def record(self, recipe_id):
+        with self._lock:
+            self._hits[recipe_id] += 1
+            if self._timer is None:
+                self._timer = threading.Timer(
+                    settings.SHORT_LINK_HITS_FLUSH_INTERVAL,
+                    self._flush_in_background,
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _take(self):
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+            self._timer = None
+        return hits
+
+    def flush(self):
+        hits = self._take()
+        if not hits:
+            return 0
+        return Recipes.objects.filter(id__in=hits).update(
+            short_link_hits=F("short_link_hits") + Case(
+                *(When(id=recipe_id, then=Value(count))
+                  for recipe_id, count in hits.items()),
+                output_field=IntegerField(),
+            )
+        )
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+
+hit_counter = HitCounter()
+atexit.register(hit_counter.flush)
+
+
+def s_redirect(request, id):
+    try:
+        recipe_id = decode_short_code(id)
+    except ValueError:
+        raise Http404
+    if not recipe_exists(recipe_id):
+        raise Http404
+    hit_counter.record(recipe_id)
+    return redirect(f"/recipes/{recipe_id}/")
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import Recipes
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_token
+from .short_links import forget_recipe
+
+USER_SERVICE_FIELDS = {"last_login"}
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not (
+        set(update_fields) - USER_SERVICE_FIELDS
+    ):
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        "key", flat=True
+    ):
+        forget_token(key)
+
+
+@receiver(post_save, sender=Recipes)
+def recipe_created(sender, instance, created, **kwargs):
+    # Сбрасывает закэшированное «рецепта нет», если ссылку уже открывали.
+    if created:
+        recipe_id = instance.pk
+        transaction.on_commit(lambda: forget_recipe(recipe_id))
+
+
+@receiver(post_delete, sender=Recipes)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: forget_recipe(recipe_id))
@@ -0,0 +1,1109 @@
+import base64
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from PIL import Image
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from foodgram.db_pool import pool_stats
+from recipes import cache_versions, catalog, scores
+from recipes.cache_versions import (
+    INGREDIENT_CATALOG_VERSION,
+    RECIPE_BODY_VERSION,
+    RECIPE_SCORES_VERSION,
+    get_version,
+)
+from recipes.images import variant_name
+from recipes.models import (
+    Favorites,
+    IngredientInRecipe,
+    Ingredients,
+    Recipes,
+    ShoppingCart,
+    ShoppingListTotal,
+)
+from recipes.search import supports_full_text_search
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+from . import async_views, benchmark, short_links
+from .authentication import CachedTokenAuthentication, token_cache_key
+
+IMAGE_NAME = "recipes/images/test.png"
+
+
+class ApiTestCase(TestCase):
+    """Автор с рецептами и пользователь без них; кэш чистый."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="author@example.com", username="author",
+            first_name="Автор", last_name="Рецептов", password="x",
+        )
+        cls.reader = User.objects.create_user(
+            email="reader@example.com", username="reader",
+            first_name="Читатель", last_name="Рецептов", password="x",
+        )
+        cls.ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=f"ингредиент {number}", measurement_unit="г")
+            for number in range(4)
+        )
+        cls.recipes = Recipes.objects.bulk_create(
+            Recipes(
+                author=cls.author, name=f"Рецепт {number}", text="Текст",
+                image=IMAGE_NAME, cooking_time=10,
+            )
+            for number in range(8)
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in cls.recipes
+            for ingredient in cls.ingredients
+        )
+        User.objects.filter(pk=cls.author.pk).update(recipes_count=8)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        self.client.force_authenticate(user)
+
+    def use_temporary_media(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(
+            MEDIA_ROOT=media_root, IMAGE_PROCESSING_WORKERS=0
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+@override_settings(QUERY_BUDGETS_ENFORCE=True)
+class RecipeListQueriesTest(ApiTestCase):
+    """Число SQL-запросов ленты не зависит от размера страницы."""
+
+    # Число строк, страница, тела рецептов, их ингредиенты
+    # и справочник ингредиентов (кэш пуст).
+    LIST_QUERIES = 5
+
+    def assert_page_queries(self, queries, limit):
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(f"/api/recipes/?limit={limit}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), limit)
+
+    def test_anonymous_list(self):
+        for limit in (2, 6):
+            with self.subTest(limit=limit):
+                self.assert_page_queries(self.LIST_QUERIES, limit)
+
+    def test_authenticated_list(self):
+        self.authenticate(self.reader)
+        for limit in (2, 6):
+            with self.subTest(limit=limit):
+                self.assert_page_queries(self.LIST_QUERIES, limit)
+
+    def test_catalog_version_read_once_per_page(self):
+        with mock.patch.object(
+            catalog, "get_version", wraps=catalog.get_version
+        ) as get_version:
+            response = self.client.get("/api/recipes/?limit=6")
+        self.assertEqual(response.status_code, 200)
+        get_version.assert_called_once_with(INGREDIENT_CATALOG_VERSION)
+
+
+class AuthorChangesTest(ApiTestCase):
+    """Кэш рецептов сбрасывается только при правке данных автора."""
+
+    def assert_bodies_invalidated(self, expected, change):
+        version = get_version(RECIPE_BODY_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(get_version(RECIPE_BODY_VERSION) != version, expected)
+
+    def test_signup_keeps_cache(self):
+        self.assert_bodies_invalidated(False, lambda: User.objects.create_user(
+            email="new@example.com", username="new",
+            first_name="Новый", last_name="Пользователь", password="x",
+        ))
+
+    def test_user_without_recipes_keeps_cache(self):
+        self.reader.first_name = "Другое"
+        self.assert_bodies_invalidated(False, self.reader.save)
+
+    def test_service_fields_keep_cache(self):
+        self.author.set_password("y")
+        self.assert_bodies_invalidated(False, self.author.save)
+
+    def test_author_name_invalidates_cache(self):
+        self.author.first_name = "Другое"
+        self.assert_bodies_invalidated(True, self.author.save)
+
+    def test_author_avatar_widths_invalidate_cache(self):
+        self.author.avatar_widths = [320]
+        self.assert_bodies_invalidated(True, lambda: self.author.save(
+            update_fields=["avatar_widths"]
+        ))
+
+
+class CountersTest(ApiTestCase):
+    """Счётчики ведут сигналы моделей, а не представления."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[0]
+
+    def counter(self, instance, field):
+        instance.refresh_from_db(fields=[field])
+        return getattr(instance, field)
+
+    def test_rows_from_orm_are_counted(self):
+        favorite = Favorites.objects.create(
+            user=self.reader, recipe=self.recipe
+        )
+        cart = ShoppingCart.objects.create(
+            user=self.reader, recipe=self.recipe
+        )
+        follow = Follow.objects.create(
+            user=self.reader, following=self.author
+        )
+        self.assertEqual(self.counter(self.recipe, "favorites_count"), 1)
+        self.assertEqual(self.counter(self.recipe, "shopping_cart_count"), 1)
+        self.assertEqual(self.counter(self.author, "followers_count"), 1)
+        favorite.save()
+        cart.delete()
+        follow.delete()
+        self.assertEqual(self.counter(self.recipe, "favorites_count"), 1)
+        self.assertEqual(self.counter(self.recipe, "shopping_cart_count"), 0)
+        self.assertEqual(self.counter(self.author, "followers_count"), 0)
+
+    def test_uncounted_rows_are_removed_through_api(self):
+        # Строки без сигналов, как из старых данных: счётчики на нуле.
+        Favorites.objects.bulk_create([
+            Favorites(user=self.reader, recipe=self.recipe)
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=self.reader, recipe=self.recipe)
+        ])
+        Follow.objects.bulk_create([
+            Follow(user=self.reader, following=self.author)
+        ])
+        self.authenticate(self.reader)
+        for url in (
+            f"/api/recipes/{self.recipe.pk}/favorite/",
+            f"/api/recipes/{self.recipe.pk}/shopping_cart/",
+            f"/api/users/{self.author.pk}/subscribe/",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.counter(self.recipe, "favorites_count"), 0)
+        self.assertEqual(self.counter(self.recipe, "shopping_cart_count"), 0)
+        self.assertEqual(self.counter(self.author, "followers_count"), 0)
+
+    def test_recipes_count(self):
+        recipe = Recipes.objects.create(
+            author=self.reader, name="Рецепт", text="Текст",
+            image=IMAGE_NAME, cooking_time=5,
+        )
+        self.assertEqual(self.counter(self.reader, "recipes_count"), 1)
+        recipe.delete()
+        self.assertEqual(self.counter(self.reader, "recipes_count"), 0)
+
+    def test_cascade_from_deleted_user(self):
+        Favorites.objects.create(user=self.reader, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipe)
+        self.reader.delete()
+        self.assertEqual(self.counter(self.recipe, "favorites_count"), 0)
+        self.assertEqual(self.counter(self.recipe, "shopping_cart_count"), 0)
+
+
+class ShoppingTotalsTest(ApiTestCase):
+    """Итоги списка покупок следуют за корзиной и ингредиентами."""
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.reader)
+        self.recipe = self.recipes[0]
+
+    def totals(self):
+        return dict(
+            ShoppingListTotal.objects.filter(user=self.reader)
+            .values_list("ingredient_id", "total")
+        )
+
+    def each(self, total):
+        return {ingredient.pk: total for ingredient in self.ingredients}
+
+    def add(self, recipe):
+        response = self.client.post(
+            f"/api/recipes/{recipe.pk}/shopping_cart/"
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_add_and_remove_through_api(self):
+        self.add(self.recipe)
+        self.add(self.recipes[1])
+        self.assertEqual(
+            self.totals(), self.each(2)
+        )
+        response = self.client.delete(
+            f"/api/recipes/{self.recipe.pk}/shopping_cart/"
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            self.totals(), self.each(1)
+        )
+
+    def test_recipe_update_through_api(self):
+        self.add(self.recipe)
+        self.use_temporary_media()
+        self.authenticate(self.author)
+        first, second = self.ingredients[:2]
+        response = self.client.patch(
+            f"/api/recipes/{self.recipe.pk}/",
+            {
+                "name": "Рецепт", "text": "Текст", "cooking_time": 5,
+                "image": png_data_url(),
+                "ingredients": [
+                    {"id": first.pk, "amount": 5},
+                    {"id": second.pk, "amount": 1},
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.totals(), {first.pk: 5, second.pk: 1})
+
+    def test_admin_style_changes(self):
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipe)
+        row = self.recipe.recipe_ingredients.get(
+            ingredient=self.ingredients[0]
+        )
+        row.amount = 4
+        row.save()
+        self.recipe.recipe_ingredients.get(
+            ingredient=self.ingredients[2]
+        ).delete()
+        row.ingredient = self.ingredients[2]
+        row.save()
+        self.assertEqual(self.totals(), {
+            self.ingredients[1].pk: 1,
+            self.ingredients[2].pk: 4,
+            self.ingredients[3].pk: 1,
+        })
+
+    def test_deleted_recipe_leaves_no_totals(self):
+        self.add(self.recipe)
+        self.add(self.recipes[1])
+        self.recipe.delete()
+        self.assertEqual(
+            self.totals(), self.each(1)
+        )
+        self.recipes[1].delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_concurrent_first_insert_is_retried(self):
+        ingredient = self.ingredients[0]
+        select_for_update = ShoppingListTotal.objects.select_for_update
+
+        def insert_after_lock():
+            # Строк ещё не было, а параллельный запрос вставил одну
+            # из них до нашего bulk_create.
+            mocked.side_effect = select_for_update
+            ShoppingListTotal.objects.create(
+                user=self.reader, ingredient=ingredient, total=2
+            )
+            return ShoppingListTotal.objects.none()
+
+        with mock.patch.object(
+            ShoppingListTotal.objects, "select_for_update",
+            side_effect=insert_after_lock,
+        ) as mocked:
+            self.add(self.recipe)
+        totals = self.totals()
+        self.assertEqual(totals.pop(ingredient.pk), 3)
+        self.assertEqual(set(totals.values()), {1})
+
+
+class CachedTokenAuthenticationTest(ApiTestCase):
+    """Токен берётся из кэша, пока его не удалят или не сохранят
+    пользователя."""
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.reader)
+        # delete() обнуляет key: это первичный ключ токена.
+        self.key = self.token.key
+        self.backend = CachedTokenAuthentication()
+
+    def authenticate_token(self):
+        return self.backend.authenticate_credentials(self.key)
+
+    def test_cached_token_needs_no_queries(self):
+        self.authenticate_token()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate_token()
+        self.assertEqual(user, self.reader)
+        self.assertEqual(token.key, self.key)
+
+    def test_deleted_token_is_forgotten(self):
+        self.authenticate_token()
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate_token()
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate_token()
+        self.reader.is_active = False
+        self.reader.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate_token()
+
+    def test_last_login_keeps_cache(self):
+        self.authenticate_token()
+        self.reader.last_login = timezone.now()
+        self.reader.save(update_fields=["last_login"])
+        self.assertIsNotNone(cache.get(token_cache_key(self.key)))
+
+
+class SubscriptionsTest(ApiTestCase):
+    """Рецепты подписок выбираются одним запросом с окном по автору."""
+
+    URL = "/api/users/subscriptions/?recipes_limit=3"
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for number, recipe in enumerate(self.recipes):
+            Recipes.objects.filter(pk=recipe.pk).update(
+                pub_date=now - timedelta(hours=number)
+            )
+        self.authenticate(self.reader)
+
+    def follow(self, count):
+        start = User.objects.count()
+        users = User.objects.bulk_create(
+            User(
+                email=f"follow{number}@example.com",
+                username=f"follow{number}",
+                first_name="Автор", last_name=str(number),
+            )
+            for number in range(start, start + count)
+        )
+        Recipes.objects.bulk_create(
+            Recipes(
+                author=user, name="Рецепт", text="Текст",
+                image=IMAGE_NAME, cooking_time=10,
+            )
+            for user in users for _ in range(2)
+        )
+        Follow.objects.bulk_create(
+            Follow(user=self.reader, following=user) for user in users
+        )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_latest_recipes_per_author(self):
+        Follow.objects.create(user=self.reader, following=self.author)
+        self.follow(1)
+        results = {
+            user["id"]: user for user in
+            self.client.get(self.URL).json()["results"]
+        }
+        author = results.pop(self.author.pk)
+        self.assertEqual(
+            [recipe["id"] for recipe in author["recipes"]],
+            [recipe.pk for recipe in self.recipes[:3]],
+        )
+        self.assertEqual(author["recipes_count"], 8)
+        (other,) = results.values()
+        self.assertEqual(len(other["recipes"]), 2)
+
+    def test_queries_do_not_grow_with_authors(self):
+        self.follow(1)
+        queries = self.count_queries()
+        self.follow(4)
+        self.assertEqual(self.count_queries(), queries)
+
+
+class RecipeSearchTest(ApiTestCase):
+    """?search= — tsvector на PostgreSQL, icontains на остальных базах."""
+
+    def setUp(self):
+        super().setUp()
+        self.soup = Recipes.objects.create(
+            author=self.author, name="Украинский борщ", text="Свёкла",
+            image=IMAGE_NAME, cooking_time=60,
+        )
+        self.salad = Recipes.objects.create(
+            author=self.author, name="Салат", text="Подавать к борщу",
+            image=IMAGE_NAME, cooking_time=10,
+        )
+
+    def search(self, query):
+        response = self.client.get("/api/recipes/", {"search": query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe["id"] for recipe in response.json()["results"]]
+
+    def test_matches_name_and_text(self):
+        self.assertEqual(
+            set(self.search("борщ")), {self.soup.pk, self.salad.pk}
+        )
+        # Регистр совпадает: LIKE в SQLite не сравнивает кириллицу
+        # без учёта регистра.
+        self.assertEqual(self.search("Салат"), [self.salad.pk])
+        self.assertEqual(self.search("окрошка"), [])
+
+    @skipUnless(
+        supports_full_text_search(connection.alias),
+        "ранжирование есть только у полнотекстового поиска",
+    )
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search("борщ"), [self.soup.pk, self.salad.pk])
+
+    @skipUnless(
+        supports_full_text_search(connection.alias),
+        "словоформы понимает только полнотекстовый поиск",
+    )
+    def test_word_forms(self):
+        self.assertIn(self.soup.pk, self.search("борщи"))
+
+
+class IngredientCoverageTest(ApiTestCase):
+    """?ingredients= — сначала рецепты, где не хватает меньше всего."""
+
+    def recipe(self, *ingredients):
+        recipe = Recipes.objects.create(
+            author=self.author, name="Рецепт", text="Текст",
+            image=IMAGE_NAME, cooking_time=10,
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def test_ordering_by_missing_then_matched(self):
+        first, second, third, fourth = self.ingredients
+        one_missing = self.recipe(first, second, third)
+        complete = self.recipe(first, second)
+        partial = self.recipe(first)
+        unrelated = self.recipe(fourth)
+        response = self.client.get(
+            "/api/recipes/",
+            {"ingredients": f"{first.pk},{second.pk}", "limit": 20},
+        )
+        ids = [recipe["id"] for recipe in response.json()["results"]]
+        self.assertEqual(ids[:3], [complete.pk, partial.pk, one_missing.pk])
+        self.assertNotIn(unrelated.pk, ids)
+        # У рецептов из setUpTestData все четыре ингредиента.
+        self.assertEqual(len(ids), 3 + len(self.recipes))
+
+
+@override_settings(SHORT_LINK_CODES="hashid")
+class ShortLinkTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        # Переходы записываются вызовом flush(), без фонового потока.
+        timer = mock.patch("api.short_links.threading.Timer")
+        timer.start()
+        self.addCleanup(timer.stop)
+        self.counter = short_links.HitCounter()
+        patched = mock.patch.object(short_links, "hit_counter", self.counter)
+        patched.start()
+        self.addCleanup(patched.stop)
+
+    def test_hashid_round_trip(self):
+        codes = set()
+        for recipe_id in (1, 2, 3, 1000, 2 ** 40 - 1):
+            code = short_links.encode_short_code(recipe_id)
+            self.assertEqual(len(code), short_links.HASHID_LENGTH)
+            self.assertEqual(
+                short_links.decode_short_code(code), recipe_id
+            )
+            codes.add(code)
+        self.assertEqual(len(codes), 5)
+        for code in ("1", "zzzzzzzzz", "zzzzzzzz", "ab-cdefg"):
+            with self.subTest(code=code):
+                with self.assertRaises(ValueError):
+                    short_links.decode_short_code(code)
+
+    def test_redirect_and_hits(self):
+        recipe = self.recipes[0]
+        response = self.client.get(f"/api/recipes/{recipe.pk}/get-link/")
+        short_link = response.json()["short-link"]
+        self.assertNotIn(f"/s/{recipe.pk}/", short_link)
+        for _ in range(3):
+            response = self.client.get(short_link)
+            self.assertRedirects(
+                response, f"/recipes/{recipe.pk}/",
+                fetch_redirect_response=False,
+            )
+        self.assertEqual(
+            self.client.get("/s/zzzzzzzz/").status_code, 404
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.short_link_hits, 0)
+        self.assertEqual(self.counter.flush(), 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.short_link_hits, 3)
+        self.assertEqual(self.counter.flush(), 0)
+
+
+class RecipeScoresTest(ApiTestCase):
+    """Оценки popular и trending и ленты по ним."""
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.guest = User.objects.create_user(
+            email="guest@example.com", username="guest",
+            first_name="Гость", last_name="Рецептов", password="x",
+        )
+        first, second, third, fourth = self.recipes[:4]
+        for user in (self.author, self.reader, self.guest):
+            self.favorite(user, first, hours=0)
+        self.favorite(self.reader, second, hours=24)
+        self.favorite(self.reader, third, hours=24 * 8)
+        for user in (self.reader, self.guest):
+            ShoppingCart.objects.create(user=user, recipe=fourth)
+
+    def favorite(self, user, recipe, hours):
+        Favorites.objects.create(
+            user=user, recipe=recipe,
+            created_at=self.now - timedelta(hours=hours),
+        )
+
+    def feed(self, ordering):
+        response = self.client.get(
+            "/api/recipes/", {"ordering": ordering, "limit": 4}
+        )
+        return [recipe["id"] for recipe in response.json()["results"]]
+
+    @override_settings(
+        RECIPE_TRENDING_WINDOW_DAYS=7, RECIPE_TRENDING_HALF_LIFE_HOURS=24
+    )
+    def test_refresh_and_feeds(self):
+        first, second, third, fourth = (
+            recipe.pk for recipe in self.recipes[:4]
+        )
+        self.assertEqual(
+            scores.trending_scores(self.now), {first: 3.0, second: 0.5}
+        )
+        version = get_version(RECIPE_SCORES_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = scores.refresh_scores(self.now)
+        self.assertEqual(result, (4, 2))
+        self.assertNotEqual(get_version(RECIPE_SCORES_VERSION), version)
+        self.assertEqual(self.feed("popular"), [first, fourth, third, second])
+        self.assertEqual(self.feed("trending")[:2], [first, second])
+
+        version = get_version(RECIPE_SCORES_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(scores.refresh_scores(self.now), (0, 0))
+        self.assertEqual(get_version(RECIPE_SCORES_VERSION), version)
+
+        # Через неделю всё избранное выходит из окна.
+        later = self.now + timedelta(days=8)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(scores.refresh_scores(later), (0, 2))
+        self.assertFalse(Recipes.objects.filter(trending_score__gt=0))
+
+
+class CursorPaginationTest(ApiTestCase):
+    """Keyset-режим проходит ленту без пропусков и повторов."""
+
+    def setUp(self):
+        super().setUp()
+        # Одинаковые даты и оценки: порядок решает id.
+        now = timezone.now()
+        for number, recipe in enumerate(self.recipes):
+            Recipes.objects.filter(pk=recipe.pk).update(
+                pub_date=now - timedelta(days=number // 3),
+                popularity=number % 2,
+            )
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [recipe["id"] for recipe in response.json()["results"]]
+            url = response.json()["next"]
+        return ids
+
+    def expected(self, *ordering):
+        return list(
+            Recipes.objects.order_by(*ordering).values_list("id", flat=True)
+        )
+
+    def test_new(self):
+        self.assertEqual(
+            self.walk("/api/recipes/?pagination=cursor&limit=3"),
+            self.expected("-pub_date", "-id"),
+        )
+
+    def test_popular(self):
+        self.assertEqual(
+            self.walk(
+                "/api/recipes/?pagination=cursor&limit=3&ordering=popular"
+            ),
+            self.expected("-popularity", "-id"),
+        )
+
+    def test_page_is_bounded_by_leading_column(self):
+        response = self.client.get("/api/recipes/?pagination=cursor&limit=3")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.json()["next"])
+        self.assertTrue(any(
+            '"pub_date" <=' in query["sql"] for query in queries
+        ))
+
+    def test_search_and_ingredients_need_ordering(self):
+        # Без полнотекстового поиска search сортировку не меняет.
+        search_status = (
+            400 if supports_full_text_search(connection.alias) else 200
+        )
+        for query, expected in (
+            ("search=Рецепт", search_status),
+            (f"ingredients={self.ingredients[0].pk}", 400),
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    f"/api/recipes/?pagination=cursor&{query}"
+                )
+                self.assertEqual(response.status_code, expected)
+                response = self.client.get(
+                    f"/api/recipes/?pagination=cursor&{query}&ordering=new"
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_subscriptions(self):
+        followed = [self.author] + [
+            User.objects.create_user(
+                email=f"user{number}@example.com", username=f"user{number}",
+                first_name="Автор", last_name="Рецептов", password="x",
+            )
+            for number in range(4)
+        ]
+        Follow.objects.bulk_create(
+            Follow(user=self.reader, following=user) for user in followed
+        )
+        self.authenticate(self.reader)
+        url = "/api/users/subscriptions/?pagination=cursor&limit=2"
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [user["id"] for user in response.json()["results"]]
+            url = response.json()["next"]
+        self.assertEqual(ids, sorted(user.pk for user in followed))
+
+
+class RecipeListCacheTest(ApiTestCase):
+    """Анонимная лента: ETag, 304 и кэш до смены версии."""
+
+    URL = "/api/recipes/?limit=2"
+
+    def test_not_modified_until_recipes_change(self):
+        response = self.client.get(self.URL)
+        etag = response["ETag"]
+        response = self.client.get(self.URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.recipes[0]
+            recipe.name = "Другое"
+            recipe.save()
+        response = self.client.get(self.URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_cached_page_is_served_without_queries(self):
+        self.client.get(self.URL)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_authenticated_list_is_not_shared(self):
+        url = "/api/recipes/?limit=8"
+        self.assertIn("Authorization", self.client.get(url)["Vary"])
+        Favorites.objects.create(user=self.reader, recipe=self.recipes[0])
+        self.authenticate(self.reader)
+        response = self.client.get(url)
+        favorited = {
+            recipe["id"] for recipe in response.json()["results"]
+            if recipe["is_favorited"]
+        }
+        self.assertEqual(favorited, {self.recipes[0].pk})
+
+
+class RecipeDetailValidatorsTest(ApiTestCase):
+    """Условный GET рецепта: ETag и Last-Modified."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/recipes/{self.recipes[0].pk}/"
+
+    def test_unchanged_recipe_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        for header, value in (
+            ("If-None-Match", response["ETag"]),
+            ("If-Modified-Since", response["Last-Modified"]),
+        ):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, headers={header: value})
+                self.assertEqual(response.status_code, 304)
+
+    def test_author_change_moves_last_modified(self):
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        later = timezone.now().timestamp() + 60
+        with mock.patch.object(
+            cache_versions.time, "time", return_value=later
+        ), self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = "Другое"
+            self.author.save()
+        response = self.client.get(
+            self.url, headers={"If-Modified-Since": last_modified}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["author"]["first_name"], "Другое")
+
+    def test_recipe_deleted_before_rendering(self):
+        with mock.patch("api.views.get_recipe_bodies", return_value={}):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+
+def png_data_url(encode=base64.b64encode, size=(8, 8)):
+    buffer = BytesIO()
+    Image.new("RGB", size, "orange").save(buffer, "PNG")
+    return "data:image/png;base64," + encode(buffer.getvalue()).decode()
+
+
+class RecipeImageTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media()
+        self.authenticate(self.author)
+        self.recipe = self.recipes[0]
+        self.recipe.image = default_storage.save(
+            IMAGE_NAME, ContentFile(b"image")
+        )
+        self.recipe.image_widths = [320]
+        self.recipe.save()
+        self.variant = default_storage.save(
+            variant_name(self.recipe.image.name, 320), ContentFile(b"webp")
+        )
+
+    def payload(self, image):
+        return {
+            "name": "Рецепт", "text": "Текст", "cooking_time": 5,
+            "image": image,
+            "ingredients": [{"id": self.ingredients[0].pk, "amount": 1}],
+        }
+
+    def test_base64_with_line_breaks(self):
+        image = png_data_url(base64.encodebytes)
+        self.assertIn("\n", image)
+        response = self.client.post(
+            "/api/recipes/", self.payload(image), format="json"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_unsupported_data_url_header(self):
+        for image in (
+            "data:image/png," + "A" * 400,
+            "data:image/" + "x" * 300 + ";base64,AAAA",
+            "data:image/svg+xml;base64,AAAA",
+        ):
+            with self.subTest(image=image[:40]):
+                response = self.client.post(
+                    "/api/recipes/", self.payload(image), format="json"
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("image", response.json())
+
+    def post_image(self, image):
+        return self.client.post(
+            "/api/recipes/", self.payload(image), format="json"
+        )
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=16)
+    def test_oversized_base64_is_rejected_before_decoding(self):
+        with mock.patch("base64.b64decode") as b64decode:
+            response = self.post_image(png_data_url())
+        self.assertEqual(response.status_code, 413)
+        b64decode.assert_not_called()
+
+    @override_settings(IMAGE_UPLOAD_MAX_DIMENSION=100)
+    def test_oversized_dimensions(self):
+        response = self.post_image(png_data_url(size=(101, 20)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("image", response.json())
+        self.assertEqual(
+            self.post_image(png_data_url(size=(100, 20))).status_code, 201
+        )
+
+    def test_invalid_base64(self):
+        for image in (
+            "data:image/png;base64,@@@@",
+            png_data_url()[:-1],
+        ):
+            with self.subTest(image=image[-8:]):
+                response = self.post_image(image)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("image", response.json())
+
+    @override_settings(API_MAX_REQUEST_SIZE=256)
+    def test_request_body_limit(self):
+        response = self.post_image(png_data_url(size=(64, 64)))
+        self.assertEqual(response.status_code, 413)
+
+    def test_replaced_image_variants_are_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                f"/api/recipes/{self.recipe.pk}/",
+                self.payload(png_data_url()), format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(default_storage.exists(self.variant))
+
+    def test_deleted_recipe_variants_are_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f"/api/recipes/{self.recipe.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(default_storage.exists(self.variant))
+
+
+class RecipeWriteQueriesTest(ApiTestCase):
+    """Создание и правка рецепта: запросы не растут с числом
+    ингредиентов, правка пишет только разницу."""
+
+    # Справочник ингредиентов, рецепт, счётчик автора, ингредиенты
+    # одной вставкой, флаги ответа и его ингредиенты; 4 — точки
+    # сохранения транзакций.
+    CREATE_QUERIES = 12
+    # Рецепт, его ингредиенты, справочник, UPDATE рецепта, ответ
+    # и 2 — точка сохранения.
+    UPDATE_QUERIES = 7
+
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media()
+        self.authenticate(self.author)
+        self.image = png_data_url()
+
+    def payload(self, ingredients, amount=1):
+        return {
+            "name": "Рецепт", "text": "Текст", "cooking_time": 5,
+            "image": self.image,
+            "ingredients": [
+                {"id": ingredient.pk, "amount": amount}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_create(self):
+        for count in (1, 4):
+            cache.clear()
+            with self.subTest(ingredients=count), self.assertNumQueries(
+                self.CREATE_QUERIES
+            ):
+                response = self.client.post(
+                    "/api/recipes/",
+                    self.payload(self.ingredients[:count]), format="json",
+                )
+                self.assertEqual(response.status_code, 201, response.content)
+
+    def test_update_writes_only_differences(self):
+        recipe = self.recipes[0]
+        # У рецепта все четыре ингредиента по 1. Изменённые строки —
+        # один bulk_update и поиск корзин; удалённые — выборка
+        # и DELETE плюс поиск корзин в post_delete на каждую строку;
+        # новые — одна вставка и поиск корзин.
+        for ingredients, amount, extra in (
+            (self.ingredients, 1, 0),
+            (self.ingredients, 2, 2),
+            (self.ingredients[2:], 3, 2 + 2 + 2),
+            (self.ingredients[:2], 3, 2 + 2 + 2),
+        ):
+            cache.clear()
+            with self.subTest(
+                ingredients=len(ingredients), amount=amount
+            ), self.assertNumQueries(self.UPDATE_QUERIES + extra):
+                response = self.client.patch(
+                    f"/api/recipes/{recipe.pk}/",
+                    self.payload(ingredients, amount), format="json",
+                )
+                self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            dict(recipe.recipe_ingredients.values_list(
+                "ingredient_id", "amount"
+            )),
+            {ingredient.pk: 3 for ingredient in self.ingredients[:2]},
+        )
+
+
+class BenchmarkWritesTest(ApiTestCase):
+    def test_create_and_update_scenarios(self):
+        self.use_temporary_media()
+        token = Token.objects.create(user=self.reader).key
+        endpoints = benchmark.write_endpoints(self.reader)
+        report = benchmark.run_benchmark(
+            benchmark.ClientRunner(token), endpoints, count=2, warmup=0
+        )
+        for name in ("recipe_create", "recipe_update"):
+            with self.subTest(name=name):
+                self.assertEqual(report["endpoints"][name]["errors"], 0)
+        benchmark.delete_write_recipes(self.reader)
+        self.assertFalse(self.reader.recipes.exists())
+
+
+@skipUnless(
+    connection.vendor == "postgresql", "EXPLAIN проверяется на PostgreSQL"
+)
+class QueryPlansTest(ApiTestCase):
+    """check_query_plans: горячие запросы могут идти по индексам.
+
+    На тестовых таблицах из нескольких строк планировщик выбрал бы
+    Seq Scan, поэтому он запрещён: тест проверяет, что нужный индекс
+    есть и подходит запросу."""
+
+    def test_hot_queries_use_indexes(self):
+        recipe = self.recipes[0]
+        Favorites.objects.create(user=self.reader, recipe=recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        Follow.objects.create(user=self.reader, following=self.author)
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        call_command("check_query_plans", stdout=StringIO())
+
+
+class AsyncRecipeDetailTest(ApiTestCase):
+    """Маршрут рецепта в режиме ASGI (SERVER_MODE=asgi)."""
+
+    def setUp(self):
+        super().setUp()
+        token = Token.objects.create(user=self.author)
+        self.client = Client(
+            enforce_csrf_checks=True,
+            HTTP_AUTHORIZATION=f"Token {token.key}",
+        )
+
+    @override_settings(ROOT_URLCONF="api.tests")
+    def test_token_delete_passes_csrf(self):
+        recipe = self.recipes[0]
+        response = self.client.delete(f"/api/recipes/{recipe.pk}/")
+        self.assertEqual(response.status_code, 204, response.content)
+        self.assertFalse(Recipes.objects.filter(pk=recipe.pk).exists())
+
+
+class ShoppingListDownloadTest(ApiTestCase):
+    URL = "/api/recipes/download_shopping_cart/?file_format=json"
+
+    def setUp(self):
+        super().setUp()
+        ShoppingListTotal.objects.bulk_create(
+            ShoppingListTotal(user=self.reader, ingredient=ingredient, total=3)
+            for ingredient in self.ingredients
+        )
+        self.token = Token.objects.create(user=self.reader).key
+
+    def expected(self):
+        return [
+            {
+                "name": ingredient.name,
+                "amount": 3,
+                "measurement_unit": ingredient.measurement_unit,
+            }
+            for ingredient in self.ingredients
+        ]
+
+    def test_wsgi_streams_sync_content(self):
+        self.authenticate(self.reader)
+        response = self.client.get(self.URL)
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)),
+            self.expected(),
+        )
+
+    @override_settings(SERVER_MODE="asgi")
+    async def test_asgi_streams_async_content(self):
+        response = await AsyncClient().get(
+            self.URL, headers={"Authorization": f"Token {self.token}"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        content = b"".join([
+            chunk async for chunk in response.streaming_content
+        ])
+        self.assertEqual(json.loads(content), self.expected())
+
+
+class MetricsViewTest(TestCase):
+    def test_allowed_network(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"foodgram_http_requests_total", response.content)
+
+    @override_settings(METRICS_ALLOWED_NETWORKS=["10.0.0.0/8"])
+    def test_other_addresses_are_forbidden(self):
+        for address in ("127.0.0.1", "192.168.1.10", "не адрес"):
+            with self.subTest(address=address):
+                response = self.client.get("/metrics", REMOTE_ADDR=address)
+                self.assertEqual(response.status_code, 403)
+        response = self.client.get("/metrics", REMOTE_ADDR="10.1.2.3")
+        self.assertEqual(response.status_code, 200)
+
+    def test_pool_stats(self):
+        self.assertNotIn(b"foodgram_db_pool_", self.client.get(
+            "/metrics"
+        ).content)
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            "requests_waiting": 2, "requests_wait_ms": 150,
+        }
+        with mock.patch.object(
+            connections["default"], "pool", pool, create=True
+        ):
+            self.assertEqual(pool_stats(), {
+                "default": {"requests_waiting": 2, "requests_wait_ms": 150},
+            })
+            content = self.client.get("/metrics").content.decode()
+        self.assertIn(
+            'foodgram_db_pool_requests_waiting{alias="default"} 2', content
+        )
+        self.assertIn(
+            'foodgram_db_pool_requests_wait_ms{alias="default"} 150', content
+        )
+
+
+urlpatterns = [
+    path("api/recipes/<int:pk>/", async_views.recipe_detail),
+]
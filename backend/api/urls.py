@@ -1,5 +1,6 @@
 """URL-конфигурация приложения 'api'."""
 
+from django.conf import settings
 from django.urls import path, include
 
 from rest_framework.routers import DefaultRouter
@@ -20,3 +21,11 @@ urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
     path('', include(router.urls))
 ]
+
+if settings.SERVER_MODE == 'asgi':
+    from . import async_views
+
+    urlpatterns = [
+        path('ingredients/', async_views.ingredients_list),
+        path('recipes/<int:pk>/', async_views.recipe_detail),
+    ] + urlpatterns
@@ -1,10 +1,11 @@
-from .utils import encode36
+from .short_links import encode_short_code, recipe_exists
+from recipes.catalog import ingredient_catalog
+from recipes.images import delete_image_variants
 from users.models import Follow, User
 from recipes.models import (
     Ingredients,
     Recipes,
     ShoppingCart,
-    IngredientInRecipe,
     Favorites,
 )
 from .serializers import (
@@ -19,19 +20,41 @@ from .serializers import (
 )
 from .permissions import IsAuthorOrReadOnly
 from .filters import RecipeFilter
+from .pagination import FeedPagination, SubscriptionsPagination
+from .caching import (
+    get_recipe_bodies,
+    list_cache_key,
+    list_version,
+    make_etag,
+    not_modified,
+    overlay_personal_flags,
+    recipe_validators,
+    recipes_version,
+    set_validators,
+)
+from .shopping_list import (
+    SHOPPING_LIST_FORMATS,
+    arender,
+    ashopping_list_rows,
+    render,
+    shopping_list_rows,
+)
 
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.core.cache import cache
 from django.urls import reverse
-from django.http import HttpResponse
-from django.db.models import Sum, F
+from django.http import Http404, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
 
-from rest_framework import viewsets, filters, status
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly,
     AllowAny, IsAuthenticated,
 )
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 
 
@@ -62,6 +85,8 @@ class UsersViewSet(viewsets.ModelViewSet):
                     {"detail": "Аватар не установлен"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            delete_image_variants(user.avatar, user.avatar_widths)
+            user.avatar_widths = []
             user.avatar.delete(save=True)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -118,7 +143,8 @@ class UsersViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        Follow.objects.create(user=user, following=following)
+        with transaction.atomic():
+            Follow.objects.create(user=user, following=following)
         serializer = FollowSerializer(
             following,
             context={"request": self.request}
@@ -133,7 +159,8 @@ class UsersViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        subscription.delete()
+        with transaction.atomic():
+            subscription.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -145,8 +172,26 @@ class UsersViewSet(viewsets.ModelViewSet):
     def follows(self, request):
         user = request.user
 
-        following = User.objects.filter(followers__user=user)
-        paginator = LimitOffsetPagination()
+        recipes = Recipes.objects.all()
+        limit = request.query_params.get("recipes_limit", "")
+        if limit.isdigit():
+            recipes = recipes.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F("author_id"),
+                    order_by=(F("pub_date").desc(), F("id").desc()),
+                )
+            ).filter(row_number__lte=int(limit))
+
+        following = (
+            User.objects
+            .filter(followers__user=user)
+            .annotate(is_subscribed=Value(True))
+            .prefetch_related(
+                Prefetch("recipes", queryset=recipes, to_attr="page_recipes")
+            )
+        )
+        paginator = SubscriptionsPagination()
         page = paginator.paginate_queryset(
             following, request)
         serializer = FollowSerializer(
@@ -169,27 +214,122 @@ class UsersViewSet(viewsets.ModelViewSet):
 class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientsSerializer
     queryset = Ingredients.objects.all()
-    filter_backends = (
-        DjangoFilterBackend,)
-    filterset_fields = ("name",)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if name:
+            return Response(ingredient_catalog.search(
+                name, settings.INGREDIENTS_SEARCH_LIMIT
+            ))
+        return Response(ingredient_catalog.all())
+
 
 class RecipesViewSet(viewsets.ModelViewSet):
 
     serializer_class = RecipesSerializer
     filterset_class = RecipeFilter
-    filter_backends = (
-        DjangoFilterBackend, filters.SearchFilter
-    )
+    pagination_class = FeedPagination
+    filter_backends = (DjangoFilterBackend,)
     permission_classes = [
         IsAuthorOrReadOnly, IsAuthenticatedOrReadOnly
     ]
     queryset = Recipes.objects.all()
 
+    def get_queryset(self):
+        queryset = (
+            Recipes.objects
+            .select_related("author")
+            .prefetch_related("recipe_ingredients")
+        )
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorites.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            author_is_subscribed=Exists(
+                Follow.objects.filter(
+                    user=user, following=OuterRef("author")
+                )
+            ),
+        )
+
+    def get_light_queryset(self):
+        return (
+            self.get_queryset()
+            .select_related(None)
+            .prefetch_related(None)
+            .only(
+                "id", "author_id", "pub_date", "updated_at",
+                "popularity", "trending_score",
+            )
+        )
+
+    def render_recipes(self, recipes):
+        bodies = get_recipe_bodies(self.request, recipes)
+        return [
+            overlay_personal_flags(bodies[recipe.pk], recipe)
+            for recipe in recipes if recipe.pk in bodies
+        ]
+
+    def render_list(self, request):
+        queryset = self.filter_queryset(self.get_light_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.render_recipes(page))
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return self.render_list(request)
+
+        version = list_version(request)
+        url = request.build_absolute_uri()
+        etag = make_etag(version, url)
+        response = not_modified(request, etag)
+        if response is None:
+            key = list_cache_key(version, url)
+            data = cache.get(key)
+            if data is None:
+                data = self.render_list(request).data
+                cache.set(key, data, settings.RECIPES_LIST_CACHE_TIMEOUT)
+            response = Response(data)
+        return set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            recipe = self.get_light_queryset().filter(
+                pk=kwargs[self.lookup_field]).first()
+        except (TypeError, ValueError):
+            recipe = None
+        if recipe is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag, last_modified = recipe_validators(
+            recipes_version(), recipe, request.user.is_authenticated
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            bodies = self.render_recipes([recipe])
+            if not bodies:
+                # Рецепт удалили между выборкой и сериализацией.
+                raise Http404
+            response = Response(bodies[0])
+        return set_validators(response, etag, last_modified)
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        image = (instance.image, instance.image_widths)
+        transaction.on_commit(lambda: delete_image_variants(*image))
+        instance.delete()
+
     @action(
         methods=["get"],
         detail=True,
@@ -197,11 +337,15 @@ class RecipesViewSet(viewsets.ModelViewSet):
         permission_classes=[AllowAny],
     )
     def get_s_link(self, request, pk=None):
-        recipe = self.get_object()
+        try:
+            recipe_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        if not recipe_exists(recipe_id):
+            raise Http404
 
-        id = encode36(recipe.id)
         short_path = reverse(
-            "s_link", args=[id]
+            "s_link", args=[encode_short_code(recipe_id)]
         )
         short_url = request.build_absolute_uri(short_path)
         return Response({"short-link": short_url})
@@ -213,33 +357,29 @@ class RecipesViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def download_shopping_list(self, request):
-        cart_items = request.user.shopping_cart.select_related("recipe")
-        recipe_ids = [item.recipe_id for item in cart_items]
-
-        needed_ingredients = (
-            IngredientInRecipe.objects
-            .filter(recipe__in=recipe_ids)
-            .values(
-                title=F("ingredient__name"),
-                measure=F("ingredient__measurement_unit"),
+        file_format = request.query_params.get("file_format", "txt")
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {"errors": "Допустимые форматы: "
+                 + ", ".join(SHOPPING_LIST_FORMATS)},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            .annotate(total=Sum("amount"))
-            .order_by("title")
-        )
 
-        text_lines = ["Список необходимых продуктов:\n"]
-        for ing in needed_ingredients:
-            text_lines.append(
-                f"* {ing['title']} — {ing['total']} {ing['measure']}"
+        file_format_spec = SHOPPING_LIST_FORMATS[file_format]
+        if settings.SERVER_MODE == "asgi":
+            content = arender(
+                file_format_spec, ashopping_list_rows(request.user)
             )
-
-        file_response = HttpResponse(
-            "\n".join(text_lines),
-            content_type="text/plain; charset=utf-8"
+        else:
+            content = render(
+                file_format_spec, shopping_list_rows(request.user)
+            )
+        file_response = StreamingHttpResponse(
+            content, content_type=file_format_spec.content_type
+        )
+        file_response["Content-Disposition"] = (
+            f'attachment; filename="my_shopping_list.{file_format}"'
         )
-        file_response[
-            "Content-Disposition"
-        ] = 'attachment; filename="my_shopping_list.txt"'
         return file_response
 
     @action(
@@ -268,10 +408,11 @@ class RecipesViewSet(viewsets.ModelViewSet):
                     {"errors": "Рецепт уже добавлен в список покупок"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            ShoppingCart.objects.create(
-                user=user,
-                recipe=recipe
-            )
+            with transaction.atomic():
+                ShoppingCart.objects.create(
+                    user=user,
+                    recipe=recipe
+                )
 
             serializer = BriefRecipesSerializer(
                 recipe,
@@ -305,9 +446,10 @@ class RecipesViewSet(viewsets.ModelViewSet):
                     {"errors": "Рецепт уже есть в избранном."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            Favorites.objects.create(
-                user=user, recipe=recipe
-            )
+            with transaction.atomic():
+                Favorites.objects.create(
+                    user=user, recipe=recipe
+                )
             serializer = BriefRecipesSerializer(
                 recipe,
                 context={"request": request}
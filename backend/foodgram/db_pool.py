@@ -0,0 +1,15 @@
+from django.db import connections
+
+
+def pool_stats():
+    """Счётчики psycopg_pool по каждой базе с включённым пулом.
+
+    requests_wait_ms — суммарное время ожидания соединения из пула,
+    requests_waiting — сколько запросов ждёт прямо сейчас.
+    """
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
@@ -0,0 +1,245 @@
+"""Счётчики запросов к API: число SQL-запросов, время в базе,
+сериализации, отрисовки и общее время по каждому представлению.
+
+Метрики живут в памяти процесса: каждый воркер gunicorn отдаёт
+на /metrics свои значения, суммирует их Prometheus. /metrics
+отвечает только адресам из METRICS_ALLOWED_NETWORKS.
+"""
+
+import ipaddress
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .db_pool import pool_stats
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("db", "serialize", "render", "total")
+# Server-Timing передаётся в заголовке, поэтому описания — ASCII.
+PHASE_DESCRIPTIONS = {
+    "db": "SQL",
+    "serialize": "Serializers",
+    "render": "Response rendering",
+    "total": "Total",
+}
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.durations = dict.fromkeys(PHASES, 0.0)
+
+    def add(self, phase, seconds):
+        self.durations[phase] += seconds
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.add("db", time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def measure(phase):
+    """Добавляет время блока к фазе текущего запроса, если он есть."""
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.add(phase, time.perf_counter() - started)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)
+        self._queries = defaultdict(int)
+        self._seconds = defaultdict(float)
+
+    def observe(self, endpoint, method, status, metrics):
+        with self._lock:
+            self._requests[(endpoint, method, str(status))] += 1
+            self._queries[endpoint] += metrics.queries
+            for phase, seconds in metrics.durations.items():
+                self._seconds[(endpoint, phase)] += seconds
+
+    def render(self):
+        with self._lock:
+            requests = dict(self._requests)
+            queries = dict(self._queries)
+            seconds = dict(self._seconds)
+        lines = [
+            "# TYPE foodgram_http_requests_total counter",
+            *(
+                f'foodgram_http_requests_total{{endpoint="{endpoint}",'
+                f'method="{method}",status="{status}"}} {count}'
+                for (endpoint, method, status), count
+                in sorted(requests.items())
+            ),
+            "# TYPE foodgram_db_queries_total counter",
+            *(
+                f'foodgram_db_queries_total{{endpoint="{endpoint}"}} {count}'
+                for endpoint, count in sorted(queries.items())
+            ),
+            "# TYPE foodgram_request_phase_seconds_total counter",
+            *(
+                f"foodgram_request_phase_seconds_total{{"
+                f'endpoint="{endpoint}",phase="{phase}"}} {value:.6f}'
+                for (endpoint, phase), value in sorted(seconds.items())
+            ),
+        ]
+        for alias, stats in sorted(pool_stats().items()):
+            lines.extend(
+                f'foodgram_db_pool_{name}{{alias="{alias}"}} {value}'
+                for name, value in sorted(stats.items())
+            )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def endpoint_name(request):
+    """Класс и действие DRF, например RecipesViewSet.list."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    view = match.func
+    view_class = getattr(view, "cls", None)
+    actions = getattr(view, "actions", None)
+    if view_class is not None and actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f"{view_class.__name__}.{action}"
+    return match.view_name or getattr(view, "__name__", "unknown")
+
+
+def server_timing(metrics):
+    return ", ".join(
+        f'{phase};dur={seconds * 1000:.1f};desc="{description}"'
+        for phase, description in PHASE_DESCRIPTIONS.items()
+        if (seconds := metrics.durations[phase]) or phase == "total"
+    ) + f', queries;desc="{metrics.queries}"'
+
+
+def check_query_budget(endpoint, metrics):
+    budget = settings.QUERY_BUDGETS.get(endpoint)
+    if budget is None or metrics.queries <= budget:
+        return
+    message = (
+        f"{endpoint}: {metrics.queries} SQL-запросов при бюджете {budget}"
+    )
+    if settings.QUERY_BUDGETS_ENFORCE:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики запроса и добавляет заголовок Server-Timing.
+
+    Должен стоять первым в MIDDLEWARE, чтобы total покрывал
+    остальные middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token, started = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics, token, started = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def start(self, request):
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(None, connection)
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: request.metrics.add(
+                "render", time.perf_counter() - started
+            )
+        )
+        return response
+
+    def finish(self, request, response, metrics, started):
+        metrics.add("total", time.perf_counter() - started)
+        endpoint = endpoint_name(request)
+        registry.observe(
+            endpoint, request.method, response.status_code, metrics
+        )
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = server_timing(metrics)
+        check_query_budget(endpoint, metrics)
+        return response
+
+
+def metrics_allowed(request):
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network.strip(), strict=False)
+        for network in settings.METRICS_ALLOWED_NETWORKS if network.strip()
+    )
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(), content_type=PROMETHEUS_CONTENT_TYPE
+    )
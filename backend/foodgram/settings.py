@@ -34,6 +34,59 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'default-secret-key')
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 
 PAGE_SIZE = 6
+INGREDIENTS_SEARCH_LIMIT = 20
+RECIPES_LIST_CACHE_TIMEOUT = 60 * 5
+RECIPE_BODY_CACHE_TIMEOUT = 60 * 60 * 24
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', 5 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_DIMENSION = int(
+    os.getenv('IMAGE_UPLOAD_MAX_DIMENSION', 6000)
+)
+SHORT_LINK_CODES = os.getenv('SHORT_LINK_CODES', 'base36')
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60
+SHORT_LINK_HITS_FLUSH_INTERVAL = 10
+# Лента trending: избранное за окно, вес добавления убывает вдвое
+# за каждый период полураспада. Оценки пересчитывает
+# refresh_recipe_scores раз в RECIPE_SCORES_REFRESH_INTERVAL секунд.
+RECIPE_TRENDING_WINDOW_DAYS = int(
+    os.getenv('RECIPE_TRENDING_WINDOW_DAYS', 7)
+)
+RECIPE_TRENDING_HALF_LIFE_HOURS = int(
+    os.getenv('RECIPE_TRENDING_HALF_LIFE_HOURS', 24)
+)
+RECIPE_SCORES_REFRESH_INTERVAL = int(
+    os.getenv('RECIPE_SCORES_REFRESH_INTERVAL', 300)
+)
+SERVER_TIMING = os.getenv('SERVER_TIMING', str(DEBUG)).lower() == 'true'
+# Сети (через запятую), из которых отдаётся /metrics; nginx этот путь
+# наружу не проксирует.
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    'METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128'
+).split(',')
+# Предельное число SQL-запросов на действие; при превышении —
+# предупреждение в лог, а с QUERY_BUDGETS_ENFORCE — ошибка (для тестов).
+# Бюджеты рассчитаны на холодный кэш и проверку токена. Потоковые
+# ответы (download_shopping_list) читают базу уже после middleware,
+# поэтому бюджета у них нет.
+QUERY_BUDGETS = {
+    'RecipesViewSet.list': 6,
+    'RecipesViewSet.retrieve': 5,
+    'RecipesViewSet.favorite': 8,
+    'RecipesViewSet.shopping_cart': 14,
+    'UsersViewSet.follows': 4,
+    'IngredientsViewSet.list': 1,
+}
+QUERY_BUDGETS_ENFORCE = (
+    os.getenv('QUERY_BUDGETS_ENFORCE', 'False').lower() == 'true'
+)
+# base64 длиннее исходных данных на треть, плюс остальные поля рецепта.
+API_MAX_REQUEST_SIZE = IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + 256 * 1024
 # Application definition
 
 INSTALLED_APPS = [
@@ -53,6 +106,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,11 +135,23 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Пул соединений psycopg (DB_POOL=True) и постоянные соединения
+# (CONN_MAX_AGE) взаимоисключающие: при включённом пуле соединение
+# возвращается в пул в конце каждого запроса.
+DB_POOL = os.getenv('DB_POOL', 'False').lower() == 'true'
+
+# wsgi или asgi; должен совпадать с режимом запуска gunicorn
+# (см. gunicorn.conf.py). Под ASGI постоянные соединения не
+# переиспользуются, поэтому вместо них стоит включить DB_POOL.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+PERSISTENT_CONNECTIONS = not DB_POOL and SERVER_MODE == 'wsgi'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -93,10 +159,39 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'foodgram_user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'foodgram_password'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': (
+            int(os.getenv('DB_CONN_MAX_AGE', 60))
+            if PERSISTENT_CONNECTIONS else 0
+        ),
+        'CONN_HEALTH_CHECKS': PERSISTENT_CONNECTIONS,
+        'OPTIONS': {},
     }
 }
 
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    }
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -151,11 +246,16 @@ DJOSER = {
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.parsers.LimitedJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
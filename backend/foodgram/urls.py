@@ -21,11 +21,17 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
-from api.utils import s_redirect
+from foodgram.metrics import metrics_view
+
+if settings.SERVER_MODE == 'asgi':
+    from api.async_views import s_redirect
+else:
+    from api.short_links import s_redirect
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('api.urls')),
     path(
         's/<str:id>/',
@@ -0,0 +1,13 @@
+import multiprocessing
+import os
+
+bind = "0.0.0.0:8000"
+workers = int(
+    os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1)
+)
+
+if os.getenv("SERVER_MODE", "wsgi").lower() == "asgi":
+    wsgi_app = "foodgram.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "foodgram.wsgi:application"
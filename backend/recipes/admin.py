@@ -24,6 +24,7 @@ class RecipeAdmin(admin.ModelAdmin):
         "author",
         "pub_date",
         "get_favorite_count",
+        "short_link_hits",
     )
     autocomplete_fields = ("author",)
     search_fields = ("name", "author__username")
@@ -34,7 +35,7 @@ class RecipeAdmin(admin.ModelAdmin):
 
     @admin.display(description="В избранном.")
     def get_favorite_count(self, obj):
-        return obj.favorited_by_user.count()
+        return obj.favorites_count
 
 
 @admin.register(Ingredients)
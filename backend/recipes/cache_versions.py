@@ -0,0 +1,46 @@
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+
+INGREDIENT_CATALOG_VERSION = "recipes:ingredient_catalog:version"
+RECIPES_VERSION = "recipes:recipes:version"
+# Меняется только при правках того, что входит в рецепт, но не
+# обновляет его updated_at: ингредиентов и профилей авторов.
+RECIPE_BODY_VERSION = "recipes:recipe_body:version"
+# Меняется после пересчёта оценок; от неё зависят только ленты
+# popular и trending.
+RECIPE_SCORES_VERSION = "recipes:recipe_scores:version"
+
+
+def new_version():
+    # Время смены в начале значения: по нему строится Last-Modified.
+    return f"{int(time.time())}-{uuid4().hex}"
+
+
+def version_timestamp(version):
+    """Время смены версии в секундах или None, если его нет в значении."""
+    stamp, separator, _ = str(version).partition("-")
+    if separator and stamp.isdigit():
+        return int(stamp)
+    return None
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, new_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, new_version(), timeout=None)
@@ -0,0 +1,139 @@
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+
+from .cache_versions import (
+    INGREDIENT_CATALOG_VERSION,
+    aget_version,
+    bump_version,
+    get_version,
+)
+from .models import Ingredients
+
+_Snapshot = namedtuple(
+    "_Snapshot", ("version", "ids", "names", "units", "keys", "order")
+)
+_EMPTY = _Snapshot(None, array("q"), (), (), (), array("l"))
+
+
+def invalidate_ingredient_catalog():
+    bump_version(INGREDIENT_CATALOG_VERSION)
+
+
+class IngredientCatalog:
+    """Копия справочника ингредиентов в памяти процесса.
+
+    Версия справочника хранится в общем кэше Django. Любое изменение
+    ингредиентов меняет версию, и каждый воркер перечитывает таблицу
+    при следующем обращении.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = _EMPTY
+
+    def _load(self, version):
+        ids = array("q")
+        names = []
+        units = []
+        rows = Ingredients.objects.order_by("id").values_list(
+            "id", "name", "measurement_unit"
+        )
+        for pk, name, unit in rows.iterator():
+            ids.append(pk)
+            names.append(name)
+            units.append(sys.intern(unit))
+        keys = [name.casefold() for name in names]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return _Snapshot(
+            version, ids, tuple(names), tuple(units),
+            tuple(keys[i] for i in order), array("l", order),
+        )
+
+    def snapshot(self):
+        version = get_version(INGREDIENT_CATALOG_VERSION)
+        if self._snapshot.version != version:
+            with self._lock:
+                if self._snapshot.version != version:
+                    self._snapshot = self._load(version)
+        return self._snapshot
+
+    @staticmethod
+    def _position(data, pk):
+        position = bisect_left(data.ids, pk)
+        if position < len(data.ids) and data.ids[position] == pk:
+            return position
+        return None
+
+    def get(self, pk):
+        return self.lookup(self.snapshot(), pk)
+
+    @classmethod
+    def lookup(cls, data, pk):
+        """(название, единица) из уже полученного снимка."""
+        position = cls._position(data, pk)
+        if position is None:
+            return None
+        return data.names[position], data.units[position]
+
+    def missing(self, pks):
+        data = self.snapshot()
+        return sorted(
+            pk for pk in set(pks) if self._position(data, pk) is None
+        )
+
+    async def asnapshot(self):
+        version = await aget_version(INGREDIENT_CATALOG_VERSION)
+        if self._snapshot.version != version:
+            self._snapshot = await sync_to_async(self._load)(version)
+        return self._snapshot
+
+    def all(self):
+        return self._all(self.snapshot())
+
+    async def aall(self):
+        return self._all(await self.asnapshot())
+
+    def search(self, query, limit):
+        return self._search(self.snapshot(), query, limit)
+
+    async def asearch(self, query, limit):
+        return self._search(await self.asnapshot(), query, limit)
+
+    @classmethod
+    def _all(cls, data):
+        return [cls._row(data, position) for position in data.order]
+
+    @classmethod
+    def _search(cls, data, query, limit):
+        """Сначала совпадения по началу названия, затем по вхождению."""
+        query = query.casefold()
+        positions = []
+        start = bisect_left(data.keys, query)
+        for index in range(start, len(data.keys)):
+            if len(positions) >= limit or not data.keys[index].startswith(
+                query
+            ):
+                break
+            positions.append(data.order[index])
+        for index, key in enumerate(data.keys):
+            if len(positions) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                positions.append(data.order[index])
+        return [cls._row(data, position) for position in positions]
+
+    @staticmethod
+    def _row(data, position):
+        return {
+            "id": data.ids[position],
+            "name": data.names[position],
+            "measurement_unit": data.units[position],
+        }
+
+
+ingredient_catalog = IngredientCatalog()
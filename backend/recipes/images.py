@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def widths_field(field_name):
+    return f"{field_name}_widths"
+
+
+def variant_name(name, width):
+    root, _ = os.path.splitext(name)
+    extension = settings.IMAGE_VARIANT_FORMAT.lower()
+    return f"{root}_{width}w.{extension}"
+
+
+def image_srcset(file, widths, build_url=None):
+    """Строка вида "url 320w, url 640w" для готовых уменьшенных копий."""
+    if not file or not widths:
+        return ""
+    entries = []
+    for width in widths:
+        url = file.storage.url(variant_name(file.name, width))
+        if build_url is not None:
+            url = build_url(url)
+        entries.append(f"{url} {width}w")
+    return ", ".join(entries)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                thread_name_prefix="images",
+            )
+        return _executor
+
+
+def _render_variants(file):
+    """Сохраняет уменьшенные копии и возвращает их ширины.
+
+    Копии шире оригинала не создаются.
+    """
+    widths = []
+    with file.storage.open(file.name) as source, Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert(
+                "RGBA" if "A" in image.getbands() else "RGB"
+            )
+        for width in sorted(settings.IMAGE_VARIANT_WIDTHS):
+            if width >= image.width:
+                break
+            height = max(1, round(image.height * width / image.width))
+            buffer = BytesIO()
+            image.resize((width, height), Image.LANCZOS).save(
+                buffer,
+                settings.IMAGE_VARIANT_FORMAT,
+                quality=settings.IMAGE_VARIANT_QUALITY,
+            )
+            name = variant_name(file.name, width)
+            file.storage.delete(name)
+            file.storage.save(name, ContentFile(buffer.getvalue()))
+            widths.append(width)
+    return widths
+
+
+def process_image(model, pk, field_name, name):
+    """Строит копии для файла name, если он всё ещё установлен у объекта."""
+    instance = model.objects.filter(pk=pk, **{field_name: name}).first()
+    if instance is None:
+        return None
+    widths = _render_variants(getattr(instance, field_name))
+    with transaction.atomic():
+        updated = model.objects.select_for_update().filter(
+            pk=pk, **{field_name: name}
+        ).first()
+        if updated is None:
+            return None
+        setattr(updated, widths_field(field_name), widths)
+        # auto_now-поля обновляются вместе с копиями, чтобы сменились
+        # ключи кэша, завязанные на время изменения.
+        updated.save(update_fields=[widths_field(field_name), *(
+            field.name for field in model._meta.concrete_fields
+            if getattr(field, "auto_now", False)
+        )])
+    return widths
+
+
+def _process_safely(model, pk, field_name, name):
+    try:
+        process_image(model, pk, field_name, name)
+    except Exception:
+        logger.exception(
+            "Не удалось обработать %s для %s #%s",
+            name, model._meta.label, pk,
+        )
+
+
+def _process_in_worker(*arguments):
+    try:
+        _process_safely(*arguments)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(instance, field_name):
+    """После коммита ставит обработку изображения в пул воркеров.
+
+    При IMAGE_PROCESSING_WORKERS = 0 обработка выполняется сразу
+    после коммита в текущем потоке.
+    """
+    file = getattr(instance, field_name)
+    if not file:
+        return
+    arguments = (type(instance), instance.pk, field_name, file.name)
+    if settings.IMAGE_PROCESSING_WORKERS:
+        transaction.on_commit(
+            lambda: _get_executor().submit(_process_in_worker, *arguments)
+        )
+    else:
+        transaction.on_commit(lambda: _process_safely(*arguments))
+
+
+def delete_image_variants(file, widths):
+    for width in widths:
+        file.storage.delete(variant_name(file.name, width))
@@ -0,0 +1,146 @@
+import csv
+import json
+from collections import namedtuple
+from itertools import islice
+from pathlib import Path
+
+from django.db import connections, transaction
+
+from .catalog import invalidate_ingredient_catalog
+from .models import Ingredients
+from .signals import invalidate_recipes
+
+BATCH_SIZE = 1000
+CSV_HEADER = ("name", "measurement_unit")
+
+ImportResult = namedtuple(
+    "ImportResult", ("read", "inserted", "updated", "skipped")
+)
+
+
+def _csv_rows(path):
+    with open(path, encoding="utf-8", newline="") as file:
+        for row in csv.reader(file):
+            if row and tuple(row[:2]) != CSV_HEADER:
+                yield row[0], row[1] if len(row) > 1 else ""
+
+
+def _json_rows(path):
+    # JSON-массив читается целиком, JSON Lines — построчно.
+    with open(path, encoding="utf-8") as file:
+        if path.suffix == ".jsonl":
+            items = (json.loads(line) for line in file if line.strip())
+        else:
+            items = json.load(file)
+        for item in items:
+            yield item.get("name", ""), item.get("measurement_unit", "")
+
+
+def read_ingredient_rows(path):
+    """Пары (название, единица) из CSV, JSON или JSON Lines."""
+    path = Path(path)
+    if path.suffix in (".json", ".jsonl"):
+        return _json_rows(path)
+    return _csv_rows(path)
+
+
+def _clean_rows(rows, stats):
+    """Отбрасывает пустые, слишком длинные и повторные названия.
+
+    При повторах остаётся первая строка.
+    """
+    name_length = Ingredients._meta.get_field("name").max_length
+    unit_length = Ingredients._meta.get_field(
+        "measurement_unit"
+    ).max_length
+    seen = set()
+    for name, unit in rows:
+        stats["read"] += 1
+        name, unit = name.strip(), unit.strip()
+        if (
+            not name or not unit or name in seen
+            or len(name) > name_length or len(unit) > unit_length
+        ):
+            stats["skipped"] += 1
+            continue
+        seen.add(name)
+        yield name, unit
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _load_with_copy(connection, rows, stats):
+    table = connection.ops.quote_name(Ingredients._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE ingredients_staging "
+            "(name varchar, measurement_unit varchar) ON COMMIT DROP"
+        )
+        with cursor.cursor.copy(
+            "COPY ingredients_staging (name, measurement_unit) FROM STDIN"
+        ) as copy:
+            staged = 0
+            for row in rows:
+                copy.write_row(row)
+                staged += 1
+        cursor.execute(
+            f"INSERT INTO {table} AS ingredient (name, measurement_unit) "
+            "SELECT name, measurement_unit FROM ingredients_staging "
+            "ON CONFLICT (name) DO UPDATE "
+            "SET measurement_unit = EXCLUDED.measurement_unit "
+            "WHERE ingredient.measurement_unit "
+            "IS DISTINCT FROM EXCLUDED.measurement_unit "
+            "RETURNING xmax = 0"
+        )
+        for (inserted,) in cursor.fetchall():
+            stats["inserted" if inserted else "updated"] += 1
+    stats["skipped"] += staged - stats["inserted"] - stats["updated"]
+
+
+def _load_in_batches(rows, stats, batch_size):
+    for batch in _batches(rows, batch_size):
+        existing = dict(Ingredients.objects.filter(
+            name__in=[name for name, _ in batch]
+        ).values_list("name", "measurement_unit"))
+        changed = []
+        for name, unit in batch:
+            if name not in existing:
+                stats["inserted"] += 1
+            elif existing[name] != unit:
+                stats["updated"] += 1
+            else:
+                stats["skipped"] += 1
+                continue
+            changed.append(Ingredients(name=name, measurement_unit=unit))
+        Ingredients.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["name"],
+            update_fields=["measurement_unit"],
+        )
+
+
+@transaction.atomic
+def load_ingredients(paths, batch_size=BATCH_SIZE):
+    """Добавляет новые ингредиенты и обновляет единицы измерения
+    существующих. На PostgreSQL строки идут через COPY во временную
+    таблицу и один INSERT ... ON CONFLICT, на остальных базах — через
+    bulk_create пачками."""
+    stats = dict.fromkeys(ImportResult._fields, 0)
+    rows = _clean_rows(
+        (row for path in paths for row in read_ingredient_rows(path)), stats
+    )
+    connection = connections[Ingredients.objects.db]
+    if connection.vendor == "postgresql":
+        _load_with_copy(connection, rows, stats)
+    else:
+        _load_in_batches(rows, stats, batch_size)
+
+    if stats["inserted"] or stats["updated"]:
+        transaction.on_commit(invalidate_ingredient_catalog)
+        invalidate_recipes(bodies=True)
+    return ImportResult(**stats)
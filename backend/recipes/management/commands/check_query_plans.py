@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.query_plans import HOT_QUERIES, check_hot_queries, sample_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет через EXPLAIN, что горячие запросы используют "
+        "ожидаемые индексы. Запускать на PostgreSQL с данными "
+        "seed_benchmark_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--analyze", action="store_true",
+            help="Сначала обновить статистику планировщика (ANALYZE).",
+        )
+        parser.add_argument(
+            "--only", action="append", metavar="QUERY",
+            choices=[query.name for query in HOT_QUERIES],
+            help="Проверить только указанные запросы.",
+        )
+
+    def handle(self, *args, analyze=False, only=None, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Проверка планов работает только с PostgreSQL.")
+        samples = sample_ids()
+        if samples is None:
+            raise CommandError(
+                "Нет данных, сначала выполните seed_benchmark_data."
+            )
+        if analyze:
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        failed = []
+        for check in check_hot_queries(samples, only):
+            status = "OK" if check.ok else "НЕТ"
+            line = (
+                f"{status:<4} {check.query.name:<22} ждём "
+                f"{check.query.index}; индексы: "
+                f"{', '.join(check.indexes) or '—'}"
+            )
+            if check.seq_scans:
+                line += f"; Seq Scan: {', '.join(check.seq_scans)}"
+            self.stdout.write(line)
+            if not check.ok:
+                failed.append(check.query.name)
+        if failed:
+            raise CommandError(
+                "Без ожидаемого индекса: " + ", ".join(failed)
+            )
+        self.stdout.write(self.style.SUCCESS("Все планы используют индексы."))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.ingredient_import import BATCH_SIZE, load_ingredients
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает ингредиенты из CSV (название,единица), JSON или "
+        "JSON Lines. Существующие названия обновляются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="+", help="Файлы для загрузки.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=BATCH_SIZE,
+            help="Размер пачки для баз без COPY.",
+        )
+
+    def handle(self, *args, paths, batch_size, **options):
+        started = time.monotonic()
+        try:
+            result = load_ingredients(paths, batch_size=batch_size)
+        except (OSError, ValueError, KeyError, AttributeError) as error:
+            raise CommandError(error)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Прочитано: {result.read}, добавлено: {result.inserted}, "
+            f"обновлено: {result.updated}, пропущено: {result.skipped} "
+            f"за {elapsed:.2f} с ({result.read / max(elapsed, 1e-6):.0f} "
+            "строк/с)"
+        ))
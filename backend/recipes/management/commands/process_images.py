@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_image, widths_field
+from recipes.models import Recipes
+from users.models import User
+
+IMAGE_FIELDS = ((Recipes, "image"), (User, "avatar"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит уменьшенные копии фото рецептов и аватаров, "
+        "для которых их ещё нет."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересоздать копии для всех изображений.",
+        )
+
+    def handle(self, *args, **options):
+        for model, field_name in IMAGE_FIELDS:
+            queryset = model.objects.exclude(
+                **{field_name: ""}
+            ).exclude(**{f"{field_name}__isnull": True})
+            if not options["all"]:
+                queryset = queryset.filter(**{widths_field(field_name): []})
+            processed = 0
+            for pk, name in queryset.values_list(
+                "pk", field_name
+            ).iterator():
+                try:
+                    process_image(model, pk, field_name, name)
+                except (OSError, ValueError) as error:
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: "
+                f"обработано {processed}"
+            ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipes
+from recipes.search import refresh_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает поисковые векторы всех рецептов."
+
+    def handle(self, *args, **options):
+        count = refresh_search_vectors(Recipes.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновлено рецептов: {count}"
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.shopping_totals import (
+    diff_shopping_totals,
+    rebuild_shopping_totals,
+)
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает итоги списков покупок по содержимому корзин."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", dest="user_ids",
+            help="Ограничиться пользователем (можно повторять).",
+        )
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Только сверить итоги, ничего не меняя.",
+        )
+
+    def handle(self, *args, user_ids=None, verify=False, **options):
+        if not verify:
+            count = rebuild_shopping_totals(user_ids)
+            self.stdout.write(self.style.SUCCESS(
+                f"Пересчитано строк: {count}"
+            ))
+            return
+
+        mismatches = diff_shopping_totals(user_ids)
+        for (user_id, ingredient_id), (stored, live) in sorted(
+            mismatches.items()
+        ):
+            self.stdout.write(
+                f"user={user_id} ingredient={ingredient_id}: "
+                f"сохранено {stored}, фактически {live}"
+            )
+        if mismatches:
+            raise CommandError(f"Расхождений: {len(mismatches)}")
+        self.stdout.write(self.style.SUCCESS("Итоги совпадают."))
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.core.management.base import BaseCommand
+
+from recipes.models import Favorites, Recipes, ShoppingCart
+from users.models import Follow, User
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset
+            .filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("*"))
+            .values("count"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики избранного, корзин, рецептов и подписчиков."
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipes.objects.update(
+            favorites_count=_count(Favorites.objects.all(), "recipe"),
+            shopping_cart_count=_count(ShoppingCart.objects.all(), "recipe"),
+        )
+        users = User.objects.update(
+            recipes_count=_count(Recipes.objects.all(), "author"),
+            followers_count=_count(Follow.objects.all(), "following"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновлено рецептов: {recipes}, пользователей: {users}"
+        ))
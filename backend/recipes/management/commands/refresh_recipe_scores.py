@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+
+from recipes.scores import refresh_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает оценки рецептов для лент popular и trending. "
+        "С --loop работает постоянно и повторяет пересчёт раз в "
+        "RECIPE_SCORES_REFRESH_INTERVAL секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Не завершаться, пересчитывать по расписанию.",
+        )
+        parser.add_argument(
+            "--interval", type=int,
+            default=settings.RECIPE_SCORES_REFRESH_INTERVAL,
+            help="Пауза между пересчётами в секундах.",
+        )
+
+    def handle(self, *args, loop=False, interval=None, **options):
+        while True:
+            started = time.monotonic()
+            with transaction.atomic():
+                result = refresh_scores()
+            self.stdout.write(self.style.SUCCESS(
+                f"Обновлено оценок popular: {result.popular}, "
+                f"trending: {result.trending} "
+                f"за {time.monotonic() - started:.1f} с"
+            ))
+            if not loop:
+                return
+            close_old_connections()
+            time.sleep(max(interval - (time.monotonic() - started), 0))
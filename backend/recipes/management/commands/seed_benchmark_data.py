@@ -0,0 +1,246 @@
+import base64
+import random
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from recipes.cache_versions import (
+    RECIPE_BODY_VERSION,
+    RECIPES_VERSION,
+    bump_version,
+)
+from recipes.models import (
+    Favorites,
+    IngredientInRecipe,
+    Ingredients,
+    Recipes,
+    ShoppingCart,
+)
+from users.models import Follow, User
+
+EMAIL_DOMAIN = "benchmark.invalid"
+PASSWORD = "benchmark-password"
+IMAGE_NAME = "recipes/images/benchmark.png"
+# PNG 1x1.
+IMAGE_BYTES = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwAD"
+    "hgGAWjR9awAAAABJRU5ErkJggg=="
+)
+# Избранное раскидывается по этому периоду, чтобы было из чего
+# считать trending.
+FAVORITES_PERIOD = timedelta(days=30)
+DISHES = ("Суп", "Салат", "Рагу", "Пирог", "Запеканка", "Паста", "Каша")
+
+
+def skewed_index(rng, size, exponent):
+    """Индекс от 0 до size - 1; маленькие выпадают чаще (степенной закон)."""
+    return min(int(size * rng.random() ** exponent), size - 1)
+
+
+def heavy_tail_count(rng, mean, cap):
+    """Число с распределением Парето и заданным средним."""
+    return min(int(mean * (rng.paretovariate(2) - 1)), cap)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт большой воспроизводимый набор данных для нагрузочных "
+        "тестов: пользователей, рецепты, избранное, корзины и подписки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50_000)
+        parser.add_argument("--recipes", type=int, default=500_000)
+        parser.add_argument(
+            "--ingredients-per-recipe", type=int, default=10,
+            help="Среднее число ингредиентов в рецепте.",
+        )
+        parser.add_argument("--favorites-per-user", type=int, default=10)
+        parser.add_argument("--cart-per-user", type=int, default=3)
+        parser.add_argument("--follows-per-user", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--clear", action="store_true",
+            help="Сначала удалить данные предыдущего запуска.",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["recipes"] < 1:
+            raise CommandError("Нужен хотя бы один пользователь и рецепт.")
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.ingredient_ids = list(
+            Ingredients.objects.order_by("id").values_list("id", flat=True)
+        )
+        if not self.ingredient_ids:
+            raise CommandError(
+                "Справочник ингредиентов пуст, сначала выполните "
+                "load_ingredients."
+            )
+        if options["clear"]:
+            self.step("Удаление старых данных", self.clear)
+        elif User.objects.filter(email__endswith=EMAIL_DOMAIN).exists():
+            raise CommandError(
+                "Данные уже созданы; используйте --clear для пересоздания."
+            )
+
+        if not default_storage.exists(IMAGE_NAME):
+            default_storage.save(IMAGE_NAME, ContentFile(IMAGE_BYTES))
+
+        user_ids = self.step(
+            "Пользователи", self.create_users, options["users"]
+        )
+        recipe_ids = self.step(
+            "Рецепты и ингредиенты", self.create_recipes,
+            user_ids, options["recipes"], options["ingredients_per_recipe"],
+        )
+        self.step(
+            "Избранное", self.create_links, Favorites,
+            user_ids, recipe_ids, options["favorites_per_user"],
+        )
+        self.step(
+            "Корзины", self.create_links, ShoppingCart,
+            user_ids, recipe_ids, options["cart_per_user"],
+        )
+        self.step(
+            "Подписки", self.create_follows,
+            user_ids, options["follows_per_user"],
+        )
+        for command in (
+            "reconcile_counters",
+            "rebuild_shopping_totals",
+            "rebuild_search_vectors",
+            "refresh_recipe_scores",
+        ):
+            self.step(command, call_command, command, verbosity=0)
+        bump_version(RECIPES_VERSION)
+        bump_version(RECIPE_BODY_VERSION)
+
+    def step(self, title, function, *args, **kwargs):
+        started = time.monotonic()
+        result = function(*args, **kwargs)
+        elapsed = time.monotonic() - started
+        count = len(result) if isinstance(result, list) else result
+        count = f": {count}" if isinstance(count, int) else ""
+        self.stdout.write(f"{title}{count} за {elapsed:.1f} с")
+        return result
+
+    def clear(self):
+        User.objects.filter(email__endswith=EMAIL_DOMAIN).delete()
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        users = (
+            User(
+                email=f"user{number}@{EMAIL_DOMAIN}",
+                username=f"bench{number}",
+                first_name=f"Имя{number % 997}",
+                last_name=f"Фамилия{number % 991}",
+                password=password,
+            )
+            for number in range(count)
+        )
+        ids = []
+        for batch in batched(users, self.batch_size):
+            ids.extend(
+                user.id for user in User.objects.bulk_create(batch)
+            )
+        return ids
+
+    def create_recipes(self, user_ids, count, ingredients_per_recipe):
+        rng = self.rng
+        names = dict(
+            Ingredients.objects.values_list("id", "name")
+        )
+        ids = []
+        for numbers in batched(range(count), self.batch_size):
+            recipes = []
+            for number in numbers:
+                main = rng.choice(self.ingredient_ids)
+                recipes.append(Recipes(
+                    author_id=user_ids[
+                        skewed_index(rng, len(user_ids), 3)
+                    ],
+                    name=f"{rng.choice(DISHES)} с {names[main]} №{number}",
+                    text=f"Рецепт №{number}: {names[main]} и другие "
+                    "ингредиенты.",
+                    image=IMAGE_NAME,
+                    cooking_time=rng.randint(5, 180),
+                ))
+            recipes = Recipes.objects.bulk_create(recipes)
+            ids.extend(recipe.id for recipe in recipes)
+            IngredientInRecipe.objects.bulk_create(
+                (
+                    IngredientInRecipe(
+                        recipe_id=recipe.id,
+                        ingredient_id=ingredient_id,
+                        amount=rng.randint(1, 500),
+                    )
+                    for recipe in recipes
+                    for ingredient_id in rng.sample(
+                        self.ingredient_ids,
+                        min(
+                            rng.randint(1, 2 * ingredients_per_recipe - 1),
+                            len(self.ingredient_ids),
+                        ),
+                    )
+                ),
+                batch_size=self.batch_size,
+            )
+        return ids
+
+    def create_links(self, model, user_ids, recipe_ids, mean):
+        rng = self.rng
+
+        now = timezone.now()
+        dated = model is Favorites
+
+        def rows():
+            for user_id in user_ids:
+                chosen = {
+                    recipe_ids[skewed_index(rng, len(recipe_ids), 2)]
+                    for _ in range(heavy_tail_count(rng, mean, 50 * mean))
+                }
+                for recipe_id in chosen:
+                    link = model(user_id=user_id, recipe_id=recipe_id)
+                    if dated:
+                        link.created_at = now - FAVORITES_PERIOD * rng.random()
+                    yield link
+
+        created = 0
+        for batch in batched(rows(), self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        return created
+
+    def create_follows(self, user_ids, mean):
+        rng = self.rng
+
+        def rows():
+            for user_id in user_ids:
+                chosen = {
+                    user_ids[skewed_index(rng, len(user_ids), 3)]
+                    for _ in range(heavy_tail_count(rng, mean, 50 * mean))
+                } - {user_id}
+                for following_id in chosen:
+                    yield Follow(user_id=user_id, following_id=following_id)
+
+        created = 0
+        for batch in batched(rows(), self.batch_size):
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        return created
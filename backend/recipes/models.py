@@ -1,7 +1,10 @@
 from users.models import User
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.utils import timezone
 
 MIN_INGREDIENT = 1
 MAX_INGREDIENT = 32000
@@ -30,11 +33,13 @@ class Ingredients(models.Model):
 
 
 class Recipes(models.Model):
+    # Индекс автора — ведущая колонка recipe_author_feed_idx.
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="recipes",
         verbose_name="Автор",
+        db_index=False,
     )
     name = models.CharField(
         max_length=256,
@@ -44,6 +49,9 @@ class Recipes(models.Model):
         upload_to="recipes/images/",
         verbose_name="Фото",
     )
+    image_widths = models.JSONField(
+        verbose_name="Ширины копий фото", default=list, editable=False
+    )
     text = models.TextField(
         verbose_name="Описание",
     )
@@ -65,26 +73,71 @@ class Recipes(models.Model):
         ],
     )
     pub_date = models.DateTimeField(
-        verbose_name="Дата добавления", auto_now_add=True, db_index=True
+        verbose_name="Дата добавления", auto_now_add=True
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения", auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном", default=0, editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name="В списках покупок", default=0, editable=False
+    )
+    short_link_hits = models.PositiveIntegerField(
+        verbose_name="Переходов по короткой ссылке", default=0,
+        editable=False,
     )
+    # Оценки для лент popular и trending пересчитывает
+    # refresh_recipe_scores, а не каждый запрос.
+    popularity = models.PositiveIntegerField(
+        verbose_name="Популярность", default=0, editable=False
+    )
+    trending_score = models.FloatField(
+        verbose_name="Рейтинг за последние дни", default=0, editable=False
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ["-pub_date"]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_feed_keyset_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_author_feed_idx",
+            ),
+            models.Index(
+                fields=["-popularity", "-id"], name="recipe_popular_idx"
+            ),
+            models.Index(
+                fields=["-trending_score", "-id"],
+                name="recipe_trending_idx",
+            ),
+            GinIndex(
+                fields=["search_vector"], name="recipe_search_vector_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name}"
 
 
 class IngredientInRecipe(models.Model):
+    # Индексы по FK заменены парой unique_recipe_in_ingredient
+    # и ingredient_recipe_idx.
     recipe = models.ForeignKey(
         Recipes, verbose_name="Рецепт",
-        on_delete=models.CASCADE, related_name="recipe_ingredients"
+        on_delete=models.CASCADE, related_name="recipe_ingredients",
+        db_index=False,
     )
     ingredient = models.ForeignKey(
         Ingredients, verbose_name="Ингредиент",
-        on_delete=models.CASCADE, related_name="recipe_ingredients"
+        on_delete=models.CASCADE, related_name="recipe_ingredients",
+        db_index=False,
     )
     amount = models.PositiveSmallIntegerField(
         verbose_name="Количество ингредиента",
@@ -102,6 +155,12 @@ class IngredientInRecipe(models.Model):
         ordering = ["recipe", "ingredient"]
         verbose_name = "Ингредиент в рецепте"
         verbose_name_plural = "Ингредиенты в рецептах"
+        indexes = [
+            models.Index(
+                fields=["ingredient", "recipe"],
+                name="ingredient_recipe_idx",
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["recipe", "ingredient"],
@@ -114,21 +173,30 @@ class IngredientInRecipe(models.Model):
 
 
 class ShoppingCart(models.Model):
+    # Поиск по пользователю идёт по unique_shopping_cart,
+    # по рецепту — по shopping_cart_recipe_idx.
     user = models.ForeignKey(
         User, verbose_name="Владелец корзины",
         on_delete=models.CASCADE,
         related_name="shopping_cart",
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipes, verbose_name="Рецепт в корзине",
         on_delete=models.CASCADE,
         related_name="in_shopping_cart",
+        db_index=False,
     )
 
     class Meta:
         verbose_name = "Рецепт из корзины"
         verbose_name_plural = "Рецепты из корзины"
         ordering = ["user", "recipe"]
+        indexes = [
+            models.Index(
+                fields=["recipe", "user"], name="shopping_cart_recipe_idx"
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["user", "recipe"],
@@ -141,21 +209,38 @@ class ShoppingCart(models.Model):
 
 
 class Favorites(models.Model):
+    # Как у корзины: unique_favorites и favorites_recipe_idx
+    # заменяют индексы по FK.
     user = models.ForeignKey(
         User, verbose_name="Пользователь",
         on_delete=models.CASCADE,
         related_name="favorite_recipes",
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipes, verbose_name="Блюдо",
         on_delete=models.CASCADE,
         related_name="favorited_by_user",
+        db_index=False,
+    )
+    # default, а не auto_now_add: seed_benchmark_data задаёт даты сам.
+    created_at = models.DateTimeField(
+        verbose_name="Дата добавления", default=timezone.now, editable=False
     )
 
     class Meta:
         ordering = ["user", "recipe"]
         verbose_name = "Избранное"
         verbose_name_plural = "Избранные"
+        indexes = [
+            models.Index(
+                fields=["recipe", "user"], name="favorites_recipe_idx"
+            ),
+            # Окно trending читается только по индексу.
+            models.Index(
+                fields=["created_at", "recipe"], name="favorites_recent_idx"
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["user", "recipe"],
@@ -165,3 +250,35 @@ class Favorites(models.Model):
 
     def __str__(self):
         return f"{self.user.username} -> {self.recipe}"
+
+
+class ShoppingListTotal(models.Model):
+    # Индекс пользователя — ведущая колонка unique_shopping_list_total.
+    user = models.ForeignKey(
+        User, verbose_name="Владелец корзины",
+        on_delete=models.CASCADE,
+        related_name="shopping_list_totals",
+        db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredients, verbose_name="Ингредиент",
+        on_delete=models.CASCADE,
+        related_name="shopping_list_totals",
+    )
+    total = models.PositiveIntegerField(
+        verbose_name="Всего в списке покупок",
+    )
+
+    class Meta:
+        verbose_name = "Итог списка покупок"
+        verbose_name_plural = "Итоги списков покупок"
+        ordering = ["user", "ingredient"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_list_total"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.total} {self.ingredient}"
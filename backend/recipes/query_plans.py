@@ -0,0 +1,191 @@
+"""Проверка планов горячих запросов через EXPLAIN.
+
+Каждый запрос строится на реальных id из базы и должен использовать
+указанный индекс. Имеет смысл на PostgreSQL с данными
+seed_benchmark_data: на маленьких таблицах планировщик честно
+выбирает Seq Scan.
+"""
+
+import json
+from collections import namedtuple
+
+from django.contrib.postgres.search import SearchQuery
+from django.db import connections
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+from users.models import Follow, User
+
+from .models import (
+    Favorites,
+    IngredientInRecipe,
+    Recipes,
+    ShoppingCart,
+    ShoppingListTotal,
+)
+from .scores import recent_favorites
+from .search import SEARCH_CONFIG
+
+HotQuery = namedtuple("HotQuery", ("name", "index", "build"))
+PlanCheck = namedtuple("PlanCheck", ("query", "indexes", "seq_scans", "ok"))
+
+FEED_ORDER = ("-pub_date", "-id")
+PAGE = 6
+
+
+def _after(recipe):
+    """Страница ленты после recipe — условие, как у курсора
+    FeedPagination.after."""
+    pub_date, pk = recipe["pub_date"], recipe["id"]
+    return Q(pub_date__lte=pub_date) & (
+        Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+    )
+
+
+def _linked(model, user_id):
+    return Exists(
+        model.objects.filter(user_id=user_id, recipe=OuterRef("pk"))
+    )
+
+
+HOT_QUERIES = (
+    HotQuery(
+        "feed", "recipe_feed_keyset_idx",
+        lambda s: Recipes.objects.order_by(*FEED_ORDER)[:PAGE],
+    ),
+    HotQuery(
+        "deep_cursor_feed", "recipe_feed_keyset_idx",
+        lambda s: Recipes.objects.filter(
+            _after(s["deep_recipe"])
+        ).order_by(*FEED_ORDER)[:PAGE],
+    ),
+    HotQuery(
+        "feed_by_author", "recipe_author_feed_idx",
+        lambda s: Recipes.objects.filter(
+            author_id=s["author"]
+        ).order_by(*FEED_ORDER)[:PAGE],
+    ),
+    HotQuery(
+        "popular_feed", "recipe_popular_idx",
+        lambda s: Recipes.objects.order_by("-popularity", "-id")[:PAGE],
+    ),
+    HotQuery(
+        "trending_feed", "recipe_trending_idx",
+        lambda s: Recipes.objects.order_by("-trending_score", "-id")[:PAGE],
+    ),
+    HotQuery(
+        "trending_window", "favorites_recent_idx",
+        lambda s: recent_favorites(timezone.now()),
+    ),
+    HotQuery(
+        "favorited_feed", "unique_favorites",
+        lambda s: Recipes.objects.filter(
+            _linked(Favorites, s["user"])
+        ).order_by(*FEED_ORDER)[:PAGE],
+    ),
+    HotQuery(
+        "not_in_cart_feed", "unique_shopping_cart",
+        lambda s: Recipes.objects.filter(
+            ~_linked(ShoppingCart, s["user"])
+        ).order_by(*FEED_ORDER)[:PAGE],
+    ),
+    HotQuery(
+        "search", "recipe_search_vector_idx",
+        lambda s: Recipes.objects.filter(search_vector=SearchQuery(
+            "суп", config=SEARCH_CONFIG, search_type="websearch"
+        )),
+    ),
+    HotQuery(
+        "recipe_favorited_by", "favorites_recipe_idx",
+        lambda s: Favorites.objects.filter(recipe_id=s["recipe"]),
+    ),
+    HotQuery(
+        "recipe_in_carts", "shopping_cart_recipe_idx",
+        lambda s: ShoppingCart.objects.filter(
+            recipe_id=s["recipe"]
+        ).values_list("user_id"),
+    ),
+    HotQuery(
+        "author_followers", "follow_following_idx",
+        lambda s: Follow.objects.filter(following_id=s["author"]),
+    ),
+    HotQuery(
+        "subscriptions", "unique_follow",
+        lambda s: Follow.objects.filter(user_id=s["user"]),
+    ),
+    HotQuery(
+        "recipe_ingredients", "unique_recipe_in_ingredient",
+        lambda s: IngredientInRecipe.objects.filter(recipe_id=s["recipe"]),
+    ),
+    HotQuery(
+        "ingredient_usage", "ingredient_recipe_idx",
+        lambda s: IngredientInRecipe.objects.filter(
+            ingredient_id=s["ingredient"]
+        ),
+    ),
+    HotQuery(
+        "shopping_list", "unique_shopping_list_total",
+        lambda s: ShoppingListTotal.objects.filter(user_id=s["user"]),
+    ),
+)
+
+
+def sample_ids():
+    """id «тяжёлых» объектов: самый активный автор, самый популярный
+    рецепт, пользователь с самой большой корзиной и рецепт в конце
+    ленты для курсора."""
+    recipe = Recipes.objects.order_by("-favorites_count", "id").first()
+    cart = (
+        ShoppingCart.objects.values("user_id")
+        .annotate(size=Count("id")).order_by("-size").first()
+    )
+    ingredient = IngredientInRecipe.objects.order_by("id").first()
+    # Рецепт, после которого в ленте осталась одна страница.
+    oldest = list(
+        Recipes.objects.order_by("pub_date", "id")
+        .values("pub_date", "id")[:PAGE + 1]
+    )
+    if recipe is None or cart is None or ingredient is None:
+        return None
+    return {
+        "author": User.objects.order_by("-recipes_count", "id").first().pk,
+        "recipe": recipe.pk,
+        "user": cart["user_id"],
+        "ingredient": ingredient.ingredient_id,
+        "deep_recipe": oldest[-1],
+    }
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _walk(child)
+
+
+def explain(queryset):
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def check_plan(query, samples):
+    nodes = list(_walk(explain(query.build(samples))))
+    indexes = sorted({
+        node["Index Name"] for node in nodes if "Index Name" in node
+    })
+    seq_scans = sorted({
+        node["Relation Name"] for node in nodes
+        if node["Node Type"] == "Seq Scan"
+    })
+    return PlanCheck(query, indexes, seq_scans, query.index in indexes)
+
+
+def check_hot_queries(samples, names=None):
+    return [
+        check_plan(query, samples) for query in HOT_QUERIES
+        if names is None or query.name in names
+    ]
@@ -0,0 +1,100 @@
+"""Оценки рецептов для лент popular и trending.
+
+popularity — сколько раз рецепт добавляли в избранное и в корзины
+за всё время (берётся из счётчиков рецепта). trending_score —
+добавления в избранное за последние RECIPE_TRENDING_WINDOW_DAYS
+дней, каждое с весом 0.5 ** (возраст / период полураспада).
+
+Оценки хранятся в колонках рецепта с индексами по (оценка, id),
+поэтому лента читается одним проходом по индексу. Пересчёт —
+командой refresh_recipe_scores.
+"""
+
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .cache_versions import RECIPE_SCORES_VERSION, bump_version
+from .models import Favorites, Recipes
+
+BATCH_SIZE = 1000
+# Округление, чтобы не переписывать рецепты из-за шума float.
+SCORE_PRECISION = 6
+
+RefreshResult = namedtuple("RefreshResult", ("popular", "trending"))
+
+
+def refresh_popularity():
+    popularity = F("favorites_count") + F("shopping_cart_count")
+    return (
+        Recipes.objects.exclude(popularity=popularity)
+        .update(popularity=popularity)
+    )
+
+
+def recent_favorites(now):
+    """Добавления в избранное внутри окна, сгруппированные по часам:
+    из базы читается не больше строк, чем пар (рецепт, час)."""
+    return (
+        Favorites.objects
+        .filter(created_at__gte=now - timedelta(
+            days=settings.RECIPE_TRENDING_WINDOW_DAYS
+        ))
+        .annotate(hour=TruncHour("created_at"))
+        .order_by()
+        .values("recipe_id", "hour")
+        .annotate(count=Count("*"))
+    )
+
+
+def trending_scores(now=None):
+    """{id рецепта: оценка} по избранному внутри окна."""
+    now = now or timezone.now()
+    half_life = timedelta(
+        hours=settings.RECIPE_TRENDING_HALF_LIFE_HOURS
+    ).total_seconds()
+    scores = defaultdict(float)
+    for row in recent_favorites(now).iterator():
+        age = max((now - row["hour"]).total_seconds(), 0)
+        scores[row["recipe_id"]] += row["count"] * 0.5 ** (age / half_life)
+    return {
+        recipe_id: round(score, SCORE_PRECISION)
+        for recipe_id, score in scores.items()
+    }
+
+
+def refresh_trending(now=None):
+    scores = trending_scores(now)
+    current = dict(
+        Recipes.objects.filter(trending_score__gt=0)
+        .values_list("id", "trending_score")
+    )
+    changed = [
+        Recipes(id=recipe_id, trending_score=score)
+        for recipe_id, score in scores.items()
+        if current.get(recipe_id) != score
+    ]
+    expired = [
+        recipe_id for recipe_id in current if recipe_id not in scores
+    ]
+    with transaction.atomic():
+        Recipes.objects.bulk_update(
+            changed, ["trending_score"], batch_size=BATCH_SIZE
+        )
+        for start in range(0, len(expired), BATCH_SIZE):
+            Recipes.objects.filter(
+                id__in=expired[start:start + BATCH_SIZE]
+            ).update(trending_score=0)
+    return len(changed) + len(expired)
+
+
+def refresh_scores(now=None):
+    result = RefreshResult(refresh_popularity(), refresh_trending(now))
+    if any(result):
+        transaction.on_commit(lambda: bump_version(RECIPE_SCORES_VERSION))
+    return result
@@ -0,0 +1,21 @@
+from django.contrib.postgres.search import SearchVector
+from django.db import connections
+
+SEARCH_CONFIG = "russian"
+
+
+def recipe_search_vector():
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("text", weight="B", config=SEARCH_CONFIG)
+    )
+
+
+def supports_full_text_search(using):
+    return connections[using].vendor == "postgresql"
+
+
+def refresh_search_vectors(queryset):
+    if not supports_full_text_search(queryset.db):
+        return 0
+    return queryset.update(search_vector=recipe_search_vector())
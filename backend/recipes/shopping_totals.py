@@ -0,0 +1,150 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+
+from .models import IngredientInRecipe, ShoppingCart, ShoppingListTotal
+
+
+def _recipe_amounts(recipe_id):
+    return dict(
+        IngredientInRecipe.objects
+        .filter(recipe_id=recipe_id)
+        .values_list("ingredient_id", "amount")
+    )
+
+
+def _apply_deltas(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if deltas:
+        with transaction.atomic():
+            _write_deltas(deltas)
+
+
+def _write_deltas(deltas):
+    existing = {
+        (row.user_id, row.ingredient_id): row
+        for row in ShoppingListTotal.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in deltas},
+            ingredient_id__in={ingredient_id for _, ingredient_id in deltas},
+        )
+    }
+    created, changed, emptied = [], [], []
+    for (user_id, ingredient_id), delta in deltas.items():
+        row = existing.get((user_id, ingredient_id))
+        if row is None:
+            if delta > 0:
+                created.append(ShoppingListTotal(
+                    user_id=user_id, ingredient_id=ingredient_id, total=delta
+                ))
+            continue
+        row.total += delta
+        if row.total > 0:
+            changed.append(row)
+        else:
+            emptied.append(row.id)
+
+    if emptied:
+        ShoppingListTotal.objects.filter(id__in=emptied).delete()
+    if changed:
+        ShoppingListTotal.objects.bulk_update(changed, ["total"])
+    if not created:
+        return
+    try:
+        with transaction.atomic():
+            ShoppingListTotal.objects.bulk_create(created)
+    except IntegrityError:
+        # Ту же строку успел создать параллельный запрос: блокировки
+        # на несуществующие строки нет. Повторяем — теперь строка есть
+        # и берётся под select_for_update.
+        _apply_deltas({
+            (row.user_id, row.ingredient_id): row.total for row in created
+        })
+
+
+def add_to_shopping_totals(user_id, recipe_id):
+    _apply_deltas({
+        (user_id, ingredient_id): amount
+        for ingredient_id, amount in _recipe_amounts(recipe_id).items()
+    })
+
+
+def remove_from_shopping_totals(user_id, recipe_id):
+    _apply_deltas({
+        (user_id, ingredient_id): -amount
+        for ingredient_id, amount in _recipe_amounts(recipe_id).items()
+    })
+
+
+def change_recipe_in_shopping_totals(recipe_id, amount_deltas):
+    """Переносит изменение ингредиентов рецепта на всех,
+    у кого он в корзине. amount_deltas: {ingredient_id: delta}."""
+    amount_deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in amount_deltas.items() if delta
+    }
+    if not amount_deltas:
+        return
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id=recipe_id).order_by().values_list("user_id", flat=True)
+    _apply_deltas({
+        (user_id, ingredient_id): delta
+        for user_id in user_ids
+        for ingredient_id, delta in amount_deltas.items()
+    })
+
+
+def live_shopping_totals(user_ids=None):
+    queryset = ShoppingCart.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    rows = (
+        queryset
+        .values_list("user_id", "recipe__recipe_ingredients__ingredient_id")
+        .annotate(total=Sum("recipe__recipe_ingredients__amount"))
+        .order_by()
+    )
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.iterator()
+        if ingredient_id is not None
+    }
+
+
+def stored_shopping_totals(user_ids=None):
+    queryset = ShoppingListTotal.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in queryset.values_list(
+            "user_id", "ingredient_id", "total"
+        ).order_by().iterator()
+    }
+
+
+def diff_shopping_totals(user_ids=None):
+    """{(user_id, ingredient_id): (сохранённое, фактическое)}
+    для всех расхождений."""
+    live = live_shopping_totals(user_ids)
+    stored = stored_shopping_totals(user_ids)
+    return {
+        key: (stored.get(key), live.get(key))
+        for key in live.keys() | stored.keys()
+        if live.get(key) != stored.get(key)
+    }
+
+
+@transaction.atomic
+def rebuild_shopping_totals(user_ids=None):
+    queryset = ShoppingListTotal.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    queryset.delete()
+    rows = [
+        ShoppingListTotal(
+            user_id=user_id, ingredient_id=ingredient_id, total=total
+        )
+        for (user_id, ingredient_id), total
+        in live_shopping_totals(user_ids).items()
+    ]
+    ShoppingListTotal.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
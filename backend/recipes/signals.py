@@ -0,0 +1,177 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache_versions import RECIPE_BODY_VERSION, RECIPES_VERSION, bump_version
+from .catalog import invalidate_ingredient_catalog
+from .models import (
+    Favorites,
+    IngredientInRecipe,
+    Ingredients,
+    Recipes,
+    ShoppingCart,
+)
+from .search import refresh_search_vectors
+from .shopping_totals import (
+    add_to_shopping_totals,
+    change_recipe_in_shopping_totals,
+    remove_from_shopping_totals,
+)
+from users.models import Follow, User
+
+SEARCHABLE_FIELDS = {"name", "text"}
+# Поля пользователя, которые попадают в рецепт как данные автора.
+AUTHOR_FIELDS = (
+    "email", "username", "first_name", "last_name", "avatar", "avatar_widths"
+)
+
+
+def invalidate_recipes(bodies=False):
+    transaction.on_commit(lambda: bump_version(RECIPES_VERSION))
+    if bodies:
+        transaction.on_commit(lambda: bump_version(RECIPE_BODY_VERSION))
+
+
+@receiver(post_save, sender=Ingredients)
+@receiver(post_delete, sender=Ingredients)
+def ingredients_changed(sender, **kwargs):
+    # После коммита: иначе другой воркер успеет перечитать старые
+    # строки под новой версией и будет держать их до следующей правки.
+    transaction.on_commit(invalidate_ingredient_catalog)
+    invalidate_recipes(bodies=True)
+
+
+def shift_counter(model, pk, field, signal, created=False):
+    """+1 при создании строки, -1 при удалении; прочие сохранения
+    счётчик не трогают. Уменьшение не уходит ниже нуля: строки из
+    админки, фикстур и каскадов могли появиться до того, как счётчик
+    начали вести."""
+    if signal is post_delete:
+        value = Greatest(F(field) - 1, 0)
+    elif created:
+        value = F(field) + 1
+    else:
+        return
+    model.objects.filter(pk=pk).update(**{field: value})
+
+
+@receiver(post_save, sender=Recipes)
+def recipe_saved(sender, instance, created=False, update_fields=None,
+                 **kwargs):
+    if update_fields is None or SEARCHABLE_FIELDS & set(update_fields):
+        refresh_search_vectors(Recipes.objects.filter(pk=instance.pk))
+    shift_counter(
+        User, instance.author_id, "recipes_count", post_save, created
+    )
+    invalidate_recipes()
+
+
+@receiver(post_delete, sender=Recipes)
+def recipe_deleted(sender, instance, **kwargs):
+    shift_counter(User, instance.author_id, "recipes_count", post_delete)
+    invalidate_recipes()
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_delete, sender=Favorites)
+def favorite_changed(sender, instance, signal, created=False, **kwargs):
+    shift_counter(
+        Recipes, instance.recipe_id, "favorites_count", signal, created
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, signal, created=False,
+                          **kwargs):
+    shift_counter(
+        Recipes, instance.recipe_id, "shopping_cart_count", signal, created
+    )
+    if signal is post_delete:
+        remove_from_shopping_totals(instance.user_id, instance.recipe_id)
+    elif created:
+        add_to_shopping_totals(instance.user_id, instance.recipe_id)
+
+
+# Итоги списков покупок следуют за ингредиентами рецептов. Удаление
+# рецепта проходит каскадом: строки корзины и ингредиентов удаляются
+# пачками, и при любом порядке пачек каждая строка вычитается ровно
+# один раз — post_delete читает уже обновлённую базу.
+# bulk_create и bulk_update сигналов не шлют: их изменения вызывающий
+# код переносит сам через change_recipe_in_shopping_totals.
+@receiver(pre_save, sender=IngredientInRecipe)
+def remember_recipe_ingredient(sender, instance, **kwargs):
+    instance._stored_amount = None
+    if not instance._state.adding:
+        instance._stored_amount = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("ingredient_id", "amount").first()
+        )
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    amount_deltas = {instance.ingredient_id: instance.amount}
+    stored = getattr(instance, "_stored_amount", None)
+    if stored is not None:
+        ingredient_id, amount = stored
+        amount_deltas[ingredient_id] = (
+            amount_deltas.get(ingredient_id, 0) - amount
+        )
+    change_recipe_in_shopping_totals(instance.recipe_id, amount_deltas)
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    change_recipe_in_shopping_totals(
+        instance.recipe_id, {instance.ingredient_id: -instance.amount}
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, signal, created=False, **kwargs):
+    shift_counter(
+        User, instance.following_id, "followers_count", signal, created
+    )
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_author_changes(sender, instance, update_fields=None, **kwargs):
+    """Сравнивает данные автора с базой до сохранения.
+
+    Новые пользователи и пользователи без рецептов в выдачу рецептов
+    не попадают. recipes_count берётся из базы: объект из кэша
+    токенов может быть устаревшим.
+    """
+    instance._author_changed = False
+    if instance._state.adding:
+        return
+    fields = [
+        field for field in AUTHOR_FIELDS
+        if update_fields is None or field in update_fields
+    ]
+    if not fields:
+        return
+    stored = (
+        sender.objects.filter(pk=instance.pk, recipes_count__gt=0)
+        .values(*fields).first()
+    )
+    instance._author_changed = stored is not None and any(
+        _stored_value(instance, field) != value
+        for field, value in stored.items()
+    )
+
+
+def _stored_value(instance, name):
+    field = instance._meta.get_field(name)
+    return field.get_prep_value(field.value_from_object(instance))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, **kwargs):
+    if getattr(instance, "_author_changed", False):
+        invalidate_recipes(bodies=True)
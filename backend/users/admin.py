@@ -16,6 +16,8 @@ class UserAdmin(BaseUserAdmin):
         "last_name",
         "is_staff",
         "is_active",
+        "recipes_count",
+        "followers_count",
     )
     search_fields = ("username", "email")
     list_filter = ("is_staff", "is_active", "is_superuser")
@@ -22,6 +22,15 @@ class User(AbstractUser):
         upload_to="users/avatars/", null=True,
         blank=True)
 
+    avatar_widths = models.JSONField(
+        verbose_name="Ширины копий аватара", default=list, editable=False)
+
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Рецептов", default=0, editable=False)
+
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Подписчиков", default=0, editable=False)
+
     REQUIRED_FIELDS = (
         "username", "first_name", "last_name"
     )
@@ -31,27 +40,43 @@ class User(AbstractUser):
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
         ordering = ["first_name", "last_name"]
+        indexes = [
+            # Курсорная пагинация подписок (SubscriptionsPagination).
+            models.Index(
+                fields=["first_name", "last_name", "id"],
+                name="user_name_keyset_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
 
 class Follow(models.Model):
+    # Отдельные индексы по FK не нужны: обе колонки ведущие
+    # в unique_follow и follow_following_idx.
     user = models.ForeignKey(
         User, verbose_name="Пользователь",
         related_name="following",
         on_delete=models.CASCADE,
+        db_index=False,
     )
     following = models.ForeignKey(
         User, verbose_name="Подписан на",
         related_name="followers",
         on_delete=models.CASCADE,
+        db_index=False,
     )
 
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
         ordering = ["user", "following"]
+        indexes = [
+            models.Index(
+                fields=["following", "user"], name="follow_following_idx"
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["user", "following"],